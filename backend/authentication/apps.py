@@ -2,4 +2,10 @@ from django.apps import AppConfig
 
 class AuthenticationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'authentication'
\ No newline at end of file
+    name = 'authentication'
+
+    def ready(self) -> None:
+        import authentication.signals  # noqa: F401
+
+        from authentication.services.bankid_poll_responses import PollResponseBodies
+        PollResponseBodies.get_instance()
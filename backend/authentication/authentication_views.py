@@ -1,19 +1,35 @@
+import json
+import math
+import httpx
 import requests
+from asgiref.sync import sync_to_async
 from rest_framework import status
 from rest_framework.request import Request
 from rest_framework.response import Response
 from .models import User
 from .jwt_authentication import JWTAuthentication
+from authentication.services.jwt_key_ring import JWTKeyRing
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.renderers import JSONRenderer
+from .renderers import QRCodeRenderer, PNGRenderer, SVGRenderer, QRMatrixRenderer
 from authentication.services.bankid_service import BankIDService
-from django.http import HttpResponse
+from authentication.services.async_bankid_service import AsyncBankIDService
+from authentication.services.bankid_event_stream import bankid_event_stream, abankid_event_stream
+from authentication.services.bankid_poll_responses import PollResponseBodies
+from authentication.services.bankid_metrics import may_scrape, render_metrics
+from authentication.services.bankid_resilience import CircuitOpenError
+from authentication.services.bankid_admission import AdmissionDenied, BankIDAdmissionController
+from django.http import HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_http_methods
+from django.core.handlers.asgi import ASGIRequest
 from django.core.exceptions import ObjectDoesNotExist
 from rest_framework import exceptions
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
-from django.utils.translation import activate
+from django.utils.translation import activate, get_language
+from typing import AsyncIterator, Dict, Iterator, Union
 
 
 @api_view(['POST'])
@@ -21,9 +37,9 @@ from django.utils.translation import activate
 def refresh_token(request: Request) -> Response:
     refresh_token_str = request.data.get('refresh_token')
     try:
-        new_access_token = JWTAuthentication.refresh_access_token(
+        new_access_token, new_refresh_token = JWTAuthentication.refresh_access_token(
             refresh_token_str)
-        return Response({'access_token': new_access_token}, status=status.HTTP_200_OK)
+        return Response({'access_token': new_access_token, 'refresh_token': new_refresh_token}, status=status.HTTP_200_OK)
     except exceptions.AuthenticationFailed as e:
         return Response({'detail': str(e)}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -38,7 +54,7 @@ def email_password_login(request: Request) -> Response:
 
     return Response({
         'access_token': JWTAuthentication.generate_jwt(user),
-        'refresh_token': JWTAuthentication.generate_refresh_token(user).token
+        'refresh_token': JWTAuthentication.generate_refresh_token(user)
     }, status=status.HTTP_200_OK)
 
 
@@ -46,11 +62,18 @@ def email_password_login(request: Request) -> Response:
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def bankid_initiate_authentication(request: Request) -> Response:
+    try:
+        BankIDAdmissionController.get_instance().admit(request.META.get('REMOTE_ADDR'))
+    except AdmissionDenied as e:
+        return Response({'detail': str(e), 'retryAfter': e.retry_after}, status=status.HTTP_429_TOO_MANY_REQUESTS, headers={'Retry-After': str(e.retry_after)})
+
     bankid_service: BankIDService = BankIDService()
     try:
         order_ref: str = bankid_service.initiate_authentication(
             end_user_ip=request.META.get('REMOTE_ADDR'))
         return Response({'orderRef': order_ref}, status=status.HTTP_200_OK)
+    except CircuitOpenError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(math.ceil(e.retry_after))})
     except requests.RequestException as e:
         return Response({
             'error': str(e),
@@ -63,18 +86,35 @@ def bankid_initiate_authentication(request: Request) -> Response:
 @csrf_exempt
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@renderer_classes([PNGRenderer, SVGRenderer, QRMatrixRenderer, JSONRenderer])
 def generate_qr_code(request: Request, order_ref: str) -> HttpResponse:
+    # Negotiated through ?format= or the Accept header, PNG unless asked otherwise.
+    # JSONRenderer is only listed so that clients asking for JSON alone get a 406 they can read.
+    renderer = request.accepted_renderer
+    if not isinstance(renderer, QRCodeRenderer):
+        return JsonResponse({'detail': 'QR codes are available as image/png, image/svg+xml or application/vnd.bankid.qr-matrix.'},
+                            status=status.HTTP_406_NOT_ACCEPTABLE)
     bankid_service = BankIDService()
     try:
         qr_data = bankid_service.generate_qr_code_data(order_ref=order_ref)
-        qr_image = bankid_service.generate_qr_code_image(qr_data=qr_data)
-        return HttpResponse(qr_image, content_type="image/png")
+        qr_image = bankid_service.generate_qr_code_image(qr_data=qr_data, format=renderer.format)
+        response = HttpResponse(qr_image, content_type=renderer.media_type)
+        response['Vary'] = 'Accept'
+        return response
     except ValueError as e:
-        return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except ObjectDoesNotExist:
-        return Response({'detail': 'Authentication not found or inactive.'}, status=status.HTTP_404_NOT_FOUND)
+        return JsonResponse({'detail': 'Authentication not found or inactive.'}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
-        return Response({'detail': f"An unexpected error occurred: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return JsonResponse({'detail': f"An unexpected error occurred: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def pending_poll_response(auth: Dict[str, object]) -> HttpResponse:
+    poll_after = auth['pollAfter']
+    if not isinstance(poll_after, int):
+        raise TypeError(f"pollAfter must be an int, got {type(poll_after).__name__}")
+    body = PollResponseBodies.get_instance().body(str(auth['status']), str(auth['hintCode']), get_language(), poll_after)
+    return HttpResponse(body, status=status.HTTP_200_OK, content_type='application/json', headers={'Retry-After': str(poll_after)})
 
 
 @csrf_exempt
@@ -84,9 +124,13 @@ def poll_authentication_status(request: Request, order_ref: str) -> Response:
     bankid_service = BankIDService()
     try:
         auth = bankid_service.poll_authentication_status(order_ref)
+        if 'pollAfter' in auth:
+            return pending_poll_response(auth)
         return Response(auth, status=status.HTTP_200_OK)
     except ValueError as e:
         return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except CircuitOpenError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(math.ceil(e.retry_after))})
     except requests.RequestException as e:
         error_message = f"Failed to poll BankID authentication status: {str(e)}"
         return Response({'detail': error_message}, status=status.HTTP_400_BAD_REQUEST)
@@ -103,6 +147,8 @@ def cancel_authentication(request: Request, order_ref: str) -> Response:
     try:
         bankid_service.cancel_authentication(order_ref=order_ref)
         return Response({'success': 'BankID authentication cancelled.'}, status=status.HTTP_204_NO_CONTENT)
+    except CircuitOpenError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(math.ceil(e.retry_after))})
     except requests.RequestException as e:
         error_message = f"Failed to poll BankID authentication status: {str(e)}"
         return Response({'detail': error_message}, status=status.HTTP_400_BAD_REQUEST)
@@ -111,6 +157,135 @@ def cancel_authentication(request: Request, order_ref: str) -> Response:
         return Response({'detail': error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@csrf_exempt
+@require_http_methods(['POST'])
+async def async_bankid_initiate_authentication(request: HttpRequest) -> JsonResponse:
+    try:
+        await BankIDAdmissionController.get_instance().aadmit(request.META.get('REMOTE_ADDR'))
+    except AdmissionDenied as e:
+        return JsonResponse({'detail': str(e), 'retryAfter': e.retry_after}, status=status.HTTP_429_TOO_MANY_REQUESTS, headers={'Retry-After': str(e.retry_after)})
+
+    bankid_service: AsyncBankIDService = AsyncBankIDService()
+    try:
+        order_ref: str = await bankid_service.initiate_authentication(
+            end_user_ip=request.META.get('REMOTE_ADDR'))
+        return JsonResponse({'orderRef': order_ref}, status=status.HTTP_200_OK)
+    except CircuitOpenError as e:
+        return JsonResponse({'detail': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(math.ceil(e.retry_after))})
+    except httpx.HTTPError as e:
+        return JsonResponse({
+            'error': str(e),
+            'detail': "Failed to initiate BankID authentication"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return JsonResponse({'detail': f"An unexpected error occurred: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@csrf_exempt
+@require_http_methods(['GET'])
+async def async_poll_authentication_status(request: HttpRequest, order_ref: str) -> JsonResponse:
+    bankid_service = AsyncBankIDService()
+    try:
+        auth = await bankid_service.poll_authentication_status(order_ref)
+        if 'pollAfter' in auth:
+            return pending_poll_response(auth)
+        return JsonResponse(auth, status=status.HTTP_200_OK)
+    except ValueError as e:
+        return JsonResponse({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except CircuitOpenError as e:
+        return JsonResponse({'detail': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(math.ceil(e.retry_after))})
+    except httpx.HTTPError as e:
+        error_message = f"Failed to poll BankID authentication status: {str(e)}"
+        return JsonResponse({'detail': error_message}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        error_message = f"An unexpected error occurred: {str(e)}"
+        return JsonResponse({'detail': error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+BATCH_POLL_MAX_ORDERS: int = 100
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+async def batch_poll_authentication_status(request: HttpRequest) -> JsonResponse:
+    # For kiosks and back-office tools: every order polled may cost an upstream collect, so callers must be signed in.
+    try:
+        authenticated = await sync_to_async(JWTAuthentication.authenticate)(request)
+    except exceptions.AuthenticationFailed as e:
+        return JsonResponse({'detail': str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+    if authenticated is None:
+        return JsonResponse({'detail': str(exceptions.NotAuthenticated.default_detail)}, status=status.HTTP_401_UNAUTHORIZED)
+
+    try:
+        order_refs = json.loads(request.body or b'{}').get('orderRefs')
+    except (ValueError, AttributeError):
+        order_refs = None
+    if not isinstance(order_refs, list) or not all(isinstance(order_ref, str) for order_ref in order_refs):
+        return JsonResponse({'detail': _('orderRefs must be a list of order references.')}, status=status.HTTP_400_BAD_REQUEST)
+    if len(order_refs) > BATCH_POLL_MAX_ORDERS:
+        return JsonResponse({'detail': _('At most %(count)d orders can be polled at once.') % {'count': BATCH_POLL_MAX_ORDERS}}, status=status.HTTP_400_BAD_REQUEST)
+
+    bankid_service = AsyncBankIDService()
+    try:
+        results = await bankid_service.poll_many(
+            order_refs,
+            max_concurrency=int(settings.BANKID.get('batch_poll_concurrency') or 16)
+        )
+        return JsonResponse({'results': results}, status=status.HTTP_200_OK)
+    except Exception as e:
+        error_message = f"An unexpected error occurred: {str(e)}"
+        return JsonResponse({'detail': error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@csrf_exempt
+@require_http_methods(['DELETE'])
+async def async_cancel_authentication(request: HttpRequest, order_ref: str) -> HttpResponse:
+    bankid_service = AsyncBankIDService()
+    try:
+        await bankid_service.cancel_authentication(order_ref=order_ref)
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+    except ValueError as e:
+        return JsonResponse({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except CircuitOpenError as e:
+        return JsonResponse({'detail': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(math.ceil(e.retry_after))})
+    except httpx.HTTPError as e:
+        error_message = f"Failed to cancel BankID authentication: {str(e)}"
+        return JsonResponse({'detail': error_message}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        error_message = f"An unexpected error occurred: {str(e)}"
+        return JsonResponse({'detail': error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@require_http_methods(['GET'])
+def bankid_metrics(request: HttpRequest) -> HttpResponse:
+    if not may_scrape(request.META.get('REMOTE_ADDR'), settings.BANKID.get('metrics_allowed_ips')):
+        return JsonResponse({'detail': 'Forbidden.'}, status=status.HTTP_403_FORBIDDEN)
+    body, content_type = render_metrics()
+    return HttpResponse(body, content_type=content_type)
+
+
+@require_http_methods(['GET'])
+def bankid_status_stream(request: HttpRequest, order_ref: str) -> StreamingHttpResponse:
+    # WSGI servers (runserver, gunicorn) only stream sync iterators, ASGI servers async ones.
+    events: Union[Iterator[str], AsyncIterator[str]]
+    if isinstance(request, ASGIRequest):
+        events = abankid_event_stream(order_ref=order_ref, language=get_language())
+    else:
+        events = bankid_event_stream(order_ref=order_ref, language=get_language())
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_http_methods(['GET'])
+def jwks(request: HttpRequest) -> HttpResponse:
+    response = HttpResponse(JWTKeyRing.get_instance().jwks, content_type='application/json')
+    # Keys are published ahead of use and retired after their tokens expire, so verifiers may cache them.
+    response['Cache-Control'] = 'public, max-age=3600, stale-while-revalidate=86400'
+    return response
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def set_language(request: Request) -> Response:
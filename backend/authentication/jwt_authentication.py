@@ -1,11 +1,18 @@
 import jwt
+import uuid
 import secrets
 from datetime import datetime
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from rest_framework.request import Request
 from rest_framework import authentication, exceptions
+from typing import Any, Dict
 from .models import User, RefreshToken
+from .services.user_principal_cache import UserPrincipal, UserPrincipalCache
+from .services.token_claims import claims_index_current, token_claims
+from .services.jwt_key_ring import JWTKeyRing
+from .services.verified_token_cache import VerifiedTokenCache
 
 class JWTAuthentication(authentication.BaseAuthentication):
     BEARER_PREFIX = 'Bearer '
@@ -14,13 +21,13 @@ class JWTAuthentication(authentication.BaseAuthentication):
     Custom JWT Authentication class.
     """
     @staticmethod
-    def authenticate(request: Request) -> tuple[User, str] | None:
+    def authenticate(request: Request) -> tuple[UserPrincipal, str] | None:
         """
         Authenticate the request using JWT token.
 
         @param request: The HTTP request object.
-        @return: A tuple containing the user and the token if authentication is successful, or None if no auth header is provided.
-        @exception: Raises AuthenticationFailed if the token is invalid, expired, or if the user does not exist.
+        @return: A tuple containing the user principal and the token if authentication is successful, or None if no auth header is provided.
+        @exception: Raises AuthenticationFailed if the token is invalid, expired, or if the user does not exist or is inactive.
         """
         auth_header = request.headers.get('Authorization')
         
@@ -32,27 +39,61 @@ class JWTAuthentication(authentication.BaseAuthentication):
         if not token:
             return None
 
-        try:
-            payload = jwt.decode(jwt=token, key=settings.JWT_AUTH['JWT_SECRET_KEY'], algorithms=[settings.JWT_AUTH['JWT_ALGORITHM']])
-        except jwt.ExpiredSignatureError as e:
-            raise exceptions.AuthenticationFailed('Token has expired')
-        except jwt.InvalidTokenError as e:
-            raise exceptions.AuthenticationFailed('Invalid token')
-        except Exception as e:
-            raise exceptions.AuthenticationFailed('Error decoding token')
-
-        try:
-            user = User.objects.get(id=payload['user_id'])
-        except User.DoesNotExist:
+        # Tokens seen before skip signature verification until they expire,
+        # the user, deactivation and permissions version checks below still run every time.
+        token_cache = VerifiedTokenCache.get_instance()
+        payload = token_cache.get(token)
+        if payload is None:
+            try:
+                payload = JWTKeyRing.get_instance().decode(token)
+            except jwt.ExpiredSignatureError as e:
+                raise exceptions.AuthenticationFailed('Token has expired')
+            except jwt.InvalidTokenError as e:
+                raise exceptions.AuthenticationFailed('Invalid token')
+            except Exception as e:
+                raise exceptions.AuthenticationFailed('Error decoding token')
+            token_cache.put(token, payload)
+
+        principal_cache = UserPrincipalCache.get_instance()
+        user = principal_cache.get(payload['user_id'])
+        if user is not None and 'pv' in payload and payload['pv'] >= user.permissions_version \
+                and not JWTAuthentication._claims_match(payload, user):
+            # The token may carry a change handled by another process, whose local entry is all that was dropped.
+            user = principal_cache.reload(payload['user_id'])
+        if user is None:
+            token_cache.discard(token)
             raise exceptions.AuthenticationFailed('User not found')
+        if not user.is_active:
+            token_cache.discard(token)
+            raise exceptions.AuthenticationFailed('User is inactive')
+
+        if 'pv' in payload:
+            # Stateless token: its claims stand in for the user's permissions as long as they are current.
+            # A token newer than the principal even after reloading it is newer than the shared cache, not outdated.
+            if payload['pv'] < user.permissions_version or (
+                    payload['pv'] == user.permissions_version and not JWTAuthentication._claims_match(payload, user)) \
+                    or not claims_index_current(payload):
+                token_cache.discard(token)
+                raise exceptions.AuthenticationFailed('Token is outdated')
+            user.claims = payload
 
         return (user, token)
 
+    @staticmethod
+    def _claims_match(payload: Dict[str, Any], user: UserPrincipal) -> bool:
+        return (payload['pv'] == user.permissions_version
+                and payload.get('account_id') == user.account_id
+                and payload.get('is_superuser') == user.is_superuser)
+
     @staticmethod
     def generate_jwt(user: User) -> str:
         """
         Generate a JWT token for the given user.
 
+        With JWT_AUTH['JWT_CLAIMS_MODE'] the token also carries the account, superuser,
+        permission and permissions version claims, see authentication.services.token_claims.
+        The token is signed by the current key of the JWTKeyRing.
+
         @param user: The user for whom the JWT token is being generated.
         @return: A JWT token as a string.
         """
@@ -61,58 +102,106 @@ class JWTAuthentication(authentication.BaseAuthentication):
             'exp': datetime.utcnow() + settings.JWT_AUTH['JWT_EXPIRATION_DELTA'],
             'iat': datetime.utcnow()
         }
-        token = jwt.encode(
-            payload=payload, key=settings.JWT_AUTH['JWT_SECRET_KEY'], algorithm=settings.JWT_AUTH['JWT_ALGORITHM']
-        )
+        if settings.JWT_AUTH.get('JWT_CLAIMS_MODE'):
+            payload.update(token_claims(user))
+        token = JWTKeyRing.get_instance().encode(payload)
         return token
 
     @staticmethod
-    def generate_refresh_token(user: User) -> RefreshToken:
+    def generate_refresh_token(user: User, family: uuid.UUID | None = None, expires_at: datetime | None = None) -> str:
         """
         Generate a refresh token for the given user.
 
+        Only the SHA-256 digest of the token is stored. A token that starts a new
+        family first revokes the user's oldest sessions beyond
+        JWT_AUTH['JWT_REFRESH_TOKENS_PER_USER'].
+
         @param user: The user for whom the refresh token is being generated.
-        @return: A RefreshToken object.
+        @param family: The family of the token being rotated, or None to start a new one.
+        @param expires_at: The expiry of the family, defaults to JWT_REFRESH_EXPIRATION_DELTA from now.
+        @return: The refresh token string, which cannot be recovered later.
+        """
+        if family is None:
+            JWTAuthentication._evict_refresh_tokens(user)
+            family = uuid.uuid4()
+        token = secrets.token_urlsafe(32)
+        RefreshToken.objects.create(
+            user_id=user.id,
+            token_hash=RefreshToken.hash_token(token),
+            family=family,
+            expires_at=expires_at or timezone.now() + settings.JWT_AUTH['JWT_REFRESH_EXPIRATION_DELTA']
+        )
+        return token
+
+    @staticmethod
+    def _evict_refresh_tokens(user: User) -> None:
+        """
+        Revoke the oldest token families of the user, leaving room for one more under the per-user cap.
+
+        @param user: The user who is about to get a new refresh token.
         """
-        refresh_token = RefreshToken.objects.create(
-            user=user,
-            token=secrets.token_urlsafe(64),
-            expires_at=timezone.now() + settings.JWT_AUTH['JWT_REFRESH_EXPIRATION_DELTA']
+        limit = settings.JWT_AUTH.get('JWT_REFRESH_TOKENS_PER_USER')
+        if not limit:
+            return
+        families = list(
+            RefreshToken.objects.filter(user_id=user.id, rotated_at__isnull=True)
+            .order_by('-created_at').values_list('family', flat=True)[limit - 1:]
         )
-        return refresh_token
+        if families:
+            RefreshToken.objects.filter(user_id=user.id, family__in=families).delete()
 
     @staticmethod
-    def refresh_access_token(refresh_token_str: str) -> str:
+    def refresh_access_token(refresh_token_str: str) -> tuple[str, str]:
         """
-        Refresh the access token using the provided refresh token.
+        Refresh the access token using the provided refresh token, and rotate the refresh token.
+
+        The token and its user are loaded in one query by the unique token hash.
+        A rotated token used again after JWT_AUTH['JWT_REFRESH_REUSE_GRACE'] has
+        most likely leaked, so its whole family is revoked.
 
         @param refresh_token_str: The refresh token string.
-        @return: A new JWT access token.
-        @exception: Raises AuthenticationFailed if the refresh token is invalid or expired.
+        @return: A new JWT access token and the refresh token replacing the one provided.
+        @exception: Raises AuthenticationFailed if the refresh token is invalid, expired or reused.
         """
+        if not refresh_token_str:
+            raise exceptions.AuthenticationFailed('Invalid refresh token')
+
         try:
-            refresh_token = RefreshToken.objects.get(token=refresh_token_str)
-            if refresh_token.is_expired():
-                raise exceptions.AuthenticationFailed('Refresh token has expired')
-            
-            # Generate new access token
-            access_token = JWTAuthentication.generate_jwt(refresh_token.user)
-            return access_token
+            refresh_token = RefreshToken.objects.select_related('user').get(
+                token_hash=RefreshToken.hash_token(refresh_token_str))
         except RefreshToken.DoesNotExist:
             raise exceptions.AuthenticationFailed('Invalid refresh token')
 
+        if refresh_token.is_expired():
+            raise exceptions.AuthenticationFailed('Refresh token has expired')
+
+        now = timezone.now()
+        # A token rotated just now (possibly by a concurrent request) may be used again within the grace period.
+        if refresh_token.rotated_at is not None \
+                and now - refresh_token.rotated_at > settings.JWT_AUTH['JWT_REFRESH_REUSE_GRACE']:
+            # Not in the rotation transaction, raising there would roll the revocation back.
+            RefreshToken.objects.filter(family=refresh_token.family).delete()
+            raise exceptions.AuthenticationFailed('Refresh token has already been used')
+
+        with transaction.atomic():
+            if refresh_token.rotated_at is None:
+                RefreshToken.objects.filter(id=refresh_token.id, rotated_at__isnull=True).update(rotated_at=now)
+            new_refresh_token = JWTAuthentication.generate_refresh_token(
+                refresh_token.user, family=refresh_token.family, expires_at=refresh_token.expires_at)
+
+        # Generate new access token
+        access_token = JWTAuthentication.generate_jwt(refresh_token.user)
+        return access_token, new_refresh_token
+
     @staticmethod
     def revoke_refresh_token(refresh_token_str: str) -> None:
         """
-        Revoke the refresh token by deleting it from the database.
+        Revoke the refresh token, and every token rotated from the same login, by deleting them from the database.
 
         @param refresh_token_str: The refresh token string.
         """
-        try:
-            refresh_token = RefreshToken.objects.get(token=refresh_token_str)
-            refresh_token.delete()
-        except RefreshToken.DoesNotExist:
-            pass  # If the token does not exist, it's already revoked
+        families = RefreshToken.objects.filter(token_hash=RefreshToken.hash_token(refresh_token_str)).values('family')
+        RefreshToken.objects.filter(family__in=families).delete()
 
     @staticmethod
     def revoke_all_refresh_tokens(user: User) -> None:
@@ -121,4 +210,4 @@ class JWTAuthentication(authentication.BaseAuthentication):
 
         @param user: The user for whom the refresh tokens are being revoked.
         """
-        RefreshToken.objects.filter(user=user).delete()
\ No newline at end of file
+        RefreshToken.objects.filter(user_id=user.id).delete()
\ No newline at end of file
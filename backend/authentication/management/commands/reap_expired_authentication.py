@@ -0,0 +1,29 @@
+# authentication/management/commands/reap_expired_authentication.py
+import threading
+from django.core.management.base import BaseCommand
+from authentication.services.expired_authentication_reaper import ExpiredAuthenticationReaper
+from typing import Any
+
+class Command(BaseCommand):
+    help = 'Delete abandoned BankID orders and expired refresh tokens in bounded batches'
+
+    def add_arguments(self, parser: Any) -> None:
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per statement')
+        parser.add_argument('--max-batches', type=int, default=100, help='Maximum number of batches per table')
+        parser.add_argument('--interval', type=float, default=None, help='Keep running, reaping every this many seconds')
+
+    def handle(self, *args: Any, **kwargs: Any) -> None:
+        reaper = ExpiredAuthenticationReaper(batch_size=kwargs['batch_size'], max_batches=kwargs['max_batches'])
+        if kwargs['interval']:
+            self.stdout.write(self.style.SUCCESS(f"Reaping expired authentication data every {kwargs['interval']}s..."))
+            try:
+                reaper.run_forever(interval=kwargs['interval'], stop_event=threading.Event())
+            except KeyboardInterrupt:
+                pass
+            return
+
+        report = reaper.reap()
+
+        self.stdout.write(self.style.SUCCESS(f"Removed {report['bankid_orders']} BankID orders."))
+        self.stdout.write(self.style.SUCCESS(f"Removed {report['refresh_tokens']} expired refresh tokens."))
+        self.stdout.write(self.style.SUCCESS(f"Reaping took {report['seconds']:.3f}s."))
@@ -0,0 +1,27 @@
+# authentication/management/commands/run_bankid_collector.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from authentication.services.bankid_collector import BankIDCollector
+from typing import Any
+
+class Command(BaseCommand):
+    help = 'Collect all active BankID orders in the background and publish their status to the cache'
+
+    def add_arguments(self, parser: Any) -> None:
+        parser.add_argument('--workers', type=int, default=None, help='Size of the collect worker pool')
+        parser.add_argument('--interval', type=float, default=None, help='Seconds between collects of the same order')
+
+    def handle(self, *args: Any, **kwargs: Any) -> None:
+        collector = BankIDCollector(
+            max_workers=kwargs['workers'] or int(settings.BANKID.get('collector_workers') or 8),
+            interval=kwargs['interval'] or float(settings.BANKID.get('collect_interval') or 2.0)
+        )
+
+        self.stdout.write(self.style.SUCCESS(f'Collecting BankID orders every {collector.interval}s...'))
+        try:
+            collector.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            collector.stop()
+            self.stdout.write(self.style.SUCCESS('BankID collector stopped.'))
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0008_user_personal_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankidauthentication',
+            name='qr_auth_codes',
+            field=models.BinaryField(default=bytes, editable=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0009_bankidauthentication_qr_auth_codes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bankidauthentication',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='refreshtoken',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
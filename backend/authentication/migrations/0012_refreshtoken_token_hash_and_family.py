@@ -0,0 +1,66 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:05
+
+import hashlib
+import uuid
+from django.db import migrations, models
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from django.db.migrations.state import StateApps
+
+
+def hash_tokens(apps: StateApps, schema_editor: BaseDatabaseSchemaEditor) -> None:
+    RefreshToken = apps.get_model('authentication', 'RefreshToken')
+    for refresh_token in RefreshToken.objects.only('id', 'token').iterator():
+        refresh_token.token_hash = hashlib.sha256(refresh_token.token.encode()).digest()
+        refresh_token.family = uuid.uuid4()
+        refresh_token.save(update_fields=['token_hash', 'family'])
+
+
+def delete_tokens(apps: StateApps, schema_editor: BaseDatabaseSchemaEditor) -> None:
+    # The raw tokens cannot be recovered from their hashes.
+    apps.get_model('authentication', 'RefreshToken').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0011_user_permissions_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='refreshtoken',
+            name='token_hash',
+            field=models.BinaryField(max_length=32, null=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='refreshtoken',
+            name='family',
+            field=models.UUIDField(null=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='refreshtoken',
+            name='rotated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(hash_tokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='refreshtoken',
+            name='token',
+        ),
+        # Reversed before `token` is added back, which cannot be filled in for existing rows.
+        migrations.RunPython(migrations.RunPython.noop, delete_tokens),
+        migrations.AlterField(
+            model_name='refreshtoken',
+            name='token_hash',
+            field=models.BinaryField(max_length=32, unique=True, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='refreshtoken',
+            name='family',
+            field=models.UUIDField(db_index=True, default=uuid.uuid4, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='refreshtoken',
+            index=models.Index(fields=['user', 'created_at'], name='refresh_token_user_created'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0012_refreshtoken_token_hash_and_family'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='bankidauthentication',
+            name='qr_auth_codes',
+        ),
+        migrations.AlterField(
+            model_name='bankidauthentication',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+    ]
@@ -1,4 +1,6 @@
+import uuid
 import bcrypt
+import hashlib
 from django.db import models
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
@@ -8,22 +10,38 @@ from django.utils import timezone
 
 
 class RefreshToken(models.Model):
+    """
+    A refresh token, stored as the SHA-256 digest of the token handed to the client.
+
+    Every use rotates the token: it is marked rotated and a successor is issued
+    in the same family, with the same expiry. Rotated tokens are kept until
+    they expire so that replaying one can be detected.
+    """
     user = models.ForeignKey(
         'User', on_delete=models.CASCADE, related_name='refresh_tokens')
-    token = models.CharField(max_length=255, unique=True)
+    token_hash = models.BinaryField(max_length=32, unique=True, editable=False)
+    family = models.UUIDField(default=uuid.uuid4, editable=False, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    expires_at = models.DateTimeField(null=True, blank=True)
+    rotated_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    @staticmethod
+    def hash_token(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
 
     def is_expired(self) -> bool:
         return timezone.now() >= self.expires_at if self.expires_at else False
 
     def __str__(self) -> str:
-        return f"RefreshToken(user={self.user}, token={self.token})"
+        return f"RefreshToken(user_id={self.user_id}, family={self.family})"
 
     class Meta:
         db_table: str = 'authentication_refresh_tokens'
         verbose_name: str = 'Refresh Token'
         verbose_name_plural: str = 'Refresh Tokens'
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='refresh_token_user_created'),
+        ]
 
 
 class AccountManager(models.Manager):
@@ -56,6 +74,7 @@ class BankIDAuthManager(models.Manager):
 
 
 class BankIDAuthentication(models.Model):
+    """Legacy order table, pending BankID orders are kept in the BankIDOrderStore"""
     order_ref = models.CharField(max_length=255, unique=True, primary_key=True)
     auto_start_token = models.CharField(max_length=255)
     qr_start_token = models.CharField(max_length=255)
@@ -140,6 +159,8 @@ class User(models.Model):
     last_name = models.CharField(max_length=30, blank=False)
     is_active = models.BooleanField(default=True)
     is_superuser = models.BooleanField(default=False)
+    """Bumped whenever the user's effective permissions change, access tokens carrying an older version are rejected"""
+    permissions_version = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_authenticated = True
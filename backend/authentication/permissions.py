@@ -5,6 +5,7 @@ from authentication.models import Account
 from typing import Type, TYPE_CHECKING
 from django.db import models
 from authentication.models import Permission
+from authentication.services.token_claims import has_permission
 
 if TYPE_CHECKING:
     from rest_framework.views import APIView
@@ -41,11 +42,12 @@ class IsSameAccountOrIsSuperuser(BasePermission):
         user = request.user
         if user.is_superuser:
             return True
-        if user.is_authenticated and isinstance(obj, Account) and obj == user.account:
+        # Compared by id, so neither the user's nor the object's account has to be loaded.
+        if user.is_authenticated and isinstance(obj, Account) and obj.id == user.account_id:
             return True
         if user.is_authenticated and not hasattr(obj, 'account'):
             return True
-        if user.is_authenticated and hasattr(obj, 'account') and obj.account == user.account:
+        if user.is_authenticated and hasattr(obj, 'account') and obj.account_id == user.account_id:
             return True
         raise PermissionDenied(detail='You do not have access to this resource as it is not associated with your account.')
 
@@ -63,7 +65,11 @@ class HasPermissionOrIsSuperuser(BasePermission):
 
         if user.is_superuser:
             return True
-        if any(permission.codename == self.permission_codename for permission in user.permissions):
+        claims = getattr(user, 'claims', None)
+        if claims is not None and 'perms' in claims:
+            if has_permission(claims, self.permission_codename):
+                return True
+        elif any(permission.codename == self.permission_codename for permission in user.permissions):
             return True
 
         permission = Permission.objects.get(codename=self.permission_codename)
@@ -0,0 +1,36 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from typing import Any, Mapping, Optional
+
+
+class QRCodeRenderer(BaseRenderer):
+    """
+    Base renderer for pre-rendered QR code frames.
+
+    These renderers only take part in content negotiation, views hand back the
+    frame bytes produced by BankIDService.generate_qr_code_image as is.
+    """
+    charset = None
+
+    def render(self, data: Any, accepted_media_type: Optional[str] = None, renderer_context: Optional[Mapping[str, Any]] = None) -> bytes:
+        if isinstance(data, bytes):
+            return data
+        # Errors DRF raises itself, e.g. 406 Not Acceptable, carry a detail dict instead of a frame.
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = JSONRenderer.media_type
+        return JSONRenderer().render(data, JSONRenderer.media_type, renderer_context)
+
+
+class PNGRenderer(QRCodeRenderer):
+    media_type = 'image/png'
+    format = 'png'
+
+
+class SVGRenderer(QRCodeRenderer):
+    media_type = 'image/svg+xml'
+    format = 'svg'
+
+
+class QRMatrixRenderer(QRCodeRenderer):
+    media_type = 'application/vnd.bankid.qr-matrix'
+    format = 'matrix'
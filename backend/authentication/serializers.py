@@ -60,5 +60,5 @@ class UserSerializer(serializers.ModelSerializer):
 class RefreshTokenSerializer(serializers.ModelSerializer):
     class Meta:
         model = RefreshToken
-        fields = ['user', 'token', 'created_at', 'expires_at']
-        read_only_fields = ['created_at', 'expires_at']
\ No newline at end of file
+        fields = ['user', 'family', 'created_at', 'rotated_at', 'expires_at']
+        read_only_fields = ['family', 'created_at', 'rotated_at', 'expires_at']
\ No newline at end of file
@@ -0,0 +1,190 @@
+import math
+import time
+import httpx
+import asyncio
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from authentication.services.bankid_service import BankIDServiceBase, issue_tokens
+from authentication.services.async_bankid_transport import AsyncBankIDTransport
+from authentication.services.bankid_order_store import get_order_store
+from authentication.services.bankid_metrics import record_collect, record_terminal_state
+from authentication.services.bankid_resilience import CircuitOpenError
+from typing import Dict, List, Union
+
+
+class AsyncBankIDService(BankIDServiceBase):
+    """
+    Asyncio counterpart of BankIDService with the same auth/collect/cancel/QR API.
+
+    Upstream calls are awaited on the event loop instead of blocking a worker
+    thread, so one process can hold many in-flight logins while BankID answers.
+    """
+
+    def __init__(self) -> None:
+        self.transport = AsyncBankIDTransport.get_instance()
+        self.policy = self.transport.policy
+        self.order_store = get_order_store()
+
+    async def _request(self, path: str, payload: Dict[str, Union[str, bool, object]]) -> httpx.Response:
+        return await self.transport.post(path=path, payload=payload)
+
+    async def initiate_authentication(self, end_user_ip: str) -> str:
+        try:
+            response: httpx.Response = await self._request(path='/rp/v6.0/auth', payload=self._auth_payload(end_user_ip))
+
+            response.raise_for_status()
+            response_data = response.json()
+
+            order = self._order(response_data)
+            await self.order_store.asave(order)
+
+            return order.order_ref
+        except httpx.HTTPError as e:
+            raise
+        except Exception as e:
+            raise
+
+    async def generate_qr_code_data(self, order_ref: str) -> str:
+        try:
+            order = await self.order_store.aget(order_ref)
+
+            if order is None:
+                raise ValueError(_("Invalid order reference."))
+
+            if self._order_age(order) > self.QR_VALIDITY_SECONDS:
+                raise ValueError(
+                    _("The BankID authentication session has expired."))
+
+            return self._qr_code_data(order)
+        except Exception as e:
+            raise
+
+    async def collect(self, order_ref: str) -> Dict[str, object]:
+        response: httpx.Response = await self._request(
+            path='/rp/v6.0/collect', payload={'orderRef': order_ref})
+
+        response.raise_for_status()
+        response_data = response.json()
+        record_collect(response_data.get('status'), response_data.get('hintCode'))
+        return self.collected_status(response_data)
+
+    async def poll_authentication_status(self, order_ref: str) -> Dict[str, Union[str, object]]:
+        try:
+            tokens = await self.order_store.aget_completion(order_ref)
+            if tokens is not None:
+                return dict(tokens)
+
+            response_data = await cache.aget(self.COLLECTED_STATUS_KEY.format(order_ref=order_ref))
+
+            if response_data is None:
+                response_data = await self.COLLECT_COALESCER.acollect(order_ref, lambda: self.collect(order_ref))
+
+            result = await self._collect_result(order_ref, response_data)
+            if result.get('status') == 'pending':
+                result['pollAfter'] = self.next_poll_delay(str(result['hintCode']), await self.order_store.aget(order_ref))
+
+            return result
+        except httpx.HTTPError as e:
+            raise
+        except Exception as e:
+            raise
+
+    async def _collect_result(self, order_ref: str, response_data: Dict[str, object]) -> Dict[str, Union[str, object]]:
+        status = str(response_data.get('status'))
+        hint_code = str(response_data.get('hintCode', ''))
+
+        if status != 'pending':
+            await cache.adelete(self.COLLECTED_STATUS_KEY.format(order_ref=order_ref))
+
+        if status == 'complete':
+            return dict(await self._complete(order_ref, self._personal_number(response_data)))
+        elif status == 'failed':
+            if await self.order_store.adelete(order_ref):
+                record_terminal_state('failed', hint_code)
+            raise ValueError(self._failed_message(hint_code))
+
+        return self._pending_result(status, hint_code)
+
+    async def _complete(self, order_ref: str, personal_number: str) -> Dict[str, str]:
+        """
+        Issue the tokens for a completed order exactly once, see BankIDService._complete.
+
+        A poll that loses the claim waits for the winner's tokens on the event
+        loop, only the database work runs in the shared sync thread.
+        """
+        tokens = await self.order_store.aget_completion(order_ref)
+        if tokens is not None:
+            return tokens
+
+        if not await self.order_store.adelete(order_ref):
+            deadline = time.monotonic() + self.COMPLETION_WAIT_SECONDS
+            while time.monotonic() < deadline:
+                await asyncio.sleep(self.COMPLETION_WAIT_INTERVAL)
+                tokens = await self.order_store.aget_completion(order_ref)
+                if tokens is not None:
+                    return tokens
+            raise ValueError(_("Invalid order reference."))
+
+        tokens = await sync_to_async(issue_tokens)(personal_number)
+        await self.order_store.asave_completion(order_ref, tokens)
+        record_terminal_state('complete')
+        return tokens
+
+    async def poll_many(self, order_refs: List[str], max_concurrency: int = 16) -> Dict[str, Dict[str, object]]:
+        """
+        Poll several orders at once, with at most max_concurrency polls in flight.
+
+        A failing order does not fail the batch, its entry carries status 'error'
+        and the error detail instead. Orders that are neither open nor completed in
+        the order store are left out of the result without calling BankID.
+
+        @param order_refs: The BankID order references.
+        @param max_concurrency: Upper bound on concurrent upstream collects.
+        @return: The poll result per order reference.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def poll(order_ref: str) -> Dict[str, object]:
+            async with semaphore:
+                try:
+                    return await self.poll_authentication_status(order_ref)
+                except ValueError as e:
+                    return {'status': 'error', 'detail': str(e)}
+                except CircuitOpenError as e:
+                    return {'status': 'error', 'detail': str(e), 'retryAfter': math.ceil(e.retry_after)}
+                except httpx.HTTPError as e:
+                    return {'status': 'error', 'detail': f"Failed to poll BankID authentication status: {str(e)}"}
+
+        async def is_known(order_ref: str) -> bool:
+            return await self.order_store.aget_completion(order_ref) is not None \
+                or await self.order_store.aget(order_ref) is not None
+
+        unique_order_refs = list(dict.fromkeys(order_refs))
+        known = await asyncio.gather(*(is_known(order_ref) for order_ref in unique_order_refs))
+        known_order_refs = [order_ref for order_ref, is_known_order in zip(unique_order_refs, known) if is_known_order]
+        results = await asyncio.gather(*(poll(order_ref) for order_ref in known_order_refs))
+        return dict(zip(known_order_refs, results))
+
+    async def cancel_authentication(self, order_ref: str) -> None:
+        try:
+            if await self.order_store.aget(order_ref) is None:
+                raise ValueError(
+                    _("Invalid order reference or the authentication is not active."))
+
+            response: httpx.Response = await self._request(path='/rp/v6.0/cancel', payload={
+                'orderRef': order_ref
+            })
+
+            response.raise_for_status()
+
+            if await self.order_store.adelete(order_ref):
+                record_terminal_state('cancelled')
+            await cache.adelete(self.COLLECTED_STATUS_KEY.format(order_ref=order_ref))
+            await self.COLLECT_COALESCER.aforget(order_ref)
+
+            return None
+        except httpx.HTTPError as e:
+            raise
+        except Exception as e:
+            raise
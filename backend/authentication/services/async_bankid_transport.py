@@ -0,0 +1,172 @@
+import os
+import ssl
+import asyncio
+import httpx
+import tempfile
+import threading
+import weakref
+from django.conf import settings
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.serialization import pkcs12
+from authentication.services.bankid_resilience import BankIDResiliencePolicy
+from authentication.services.bankid_metrics import observe_upstream_call, operation_for, record_upstream_error
+from typing import Dict, Optional, Set, Union
+
+
+def load_pkcs12_ssl_context(pkcs12_file: str, pkcs12_password: str, verify: Union[str, bool]) -> ssl.SSLContext:
+    """
+    Build a client SSL context from a PKCS#12 bundle.
+
+    The ssl module can only load certificate chains from disk, so the key is
+    re-encrypted with the bundle password and written to a short-lived temporary
+    file that is removed as soon as it has been loaded.
+
+    @param pkcs12_file: Path to the PKCS#12 certificate.
+    @param pkcs12_password: Password of the PKCS#12 certificate.
+    @param verify: Path to the CA certificate, or a bool as accepted by requests.
+    @return: An SSLContext presenting the client certificate.
+    """
+    password = pkcs12_password.encode()
+    with open(pkcs12_file, 'rb') as f:
+        private_key, certificate, additional_certificates = pkcs12.load_key_and_certificates(f.read(), password)
+    if private_key is None or certificate is None:
+        raise ValueError(f'{pkcs12_file} does not contain a private key and certificate')
+
+    if isinstance(verify, str):
+        context = ssl.create_default_context(cafile=verify)
+    else:
+        context = ssl.create_default_context()
+        if verify is False:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+
+    pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.BestAvailableEncryption(password)
+    )
+    pem += certificate.public_bytes(serialization.Encoding.PEM)
+    for additional_certificate in additional_certificates or []:
+        pem += additional_certificate.public_bytes(serialization.Encoding.PEM)
+
+    fd, path = tempfile.mkstemp(suffix='.pem')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pem)
+        context.load_cert_chain(certfile=path, password=pkcs12_password)
+    finally:
+        os.remove(path)
+
+    return context
+
+
+class AsyncBankIDTransport():
+    """
+    Asyncio mTLS transport for the BankID RP API.
+
+    The SSL context is built once per process. httpx connection pools are bound
+    to the event loop that created them, so one client is kept per running loop
+    and closed when that loop shuts down.
+    """
+    _ssl_context: Optional[ssl.SSLContext] = None
+    _ssl_context_lock = threading.Lock()
+    _instances: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncBankIDTransport]' = weakref.WeakKeyDictionary()
+    _closers: Set['asyncio.Task[None]'] = set()
+
+    def __init__(self, base_url: str, ssl_context: ssl.SSLContext, max_connections: int = 100) -> None:
+        self.policy = BankIDResiliencePolicy.get_instance()
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            verify=ssl_context,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            )
+        )
+
+    @classmethod
+    def _get_ssl_context(cls) -> ssl.SSLContext:
+        if cls._ssl_context is None:
+            with cls._ssl_context_lock:
+                if cls._ssl_context is None:
+                    cls._ssl_context = load_pkcs12_ssl_context(
+                        pkcs12_file=settings.BANKID['p12_cert_path'],
+                        pkcs12_password=settings.BANKID['p12_password'],
+                        verify=settings.BANKID['ca_cert_path']
+                    )
+        return cls._ssl_context
+
+    @classmethod
+    def get_instance(cls) -> 'AsyncBankIDTransport':
+        """
+        Return the transport for the running event loop, creating it on first use.
+
+        @return: The AsyncBankIDTransport bound to the current event loop.
+        """
+        loop = asyncio.get_running_loop()
+        instance = cls._instances.get(loop)
+        if instance is None:
+            instance = cls(
+                base_url=settings.BANKID['endpoint'],
+                ssl_context=cls._get_ssl_context(),
+                max_connections=int(settings.BANKID.get('async_max_connections') or 100)
+            )
+            cls._instances[loop] = instance
+            # asyncio.run() and async_to_sync() cancel the tasks left on a loop before
+            # closing it. Under WSGI every async view runs on a loop of its own.
+            closer = loop.create_task(instance._close_on_shutdown(loop))
+            cls._closers.add(closer)
+            closer.add_done_callback(cls._closers.discard)
+        return instance
+
+    async def _close_on_shutdown(self, loop: asyncio.AbstractEventLoop) -> None:
+        try:
+            await loop.create_future()
+        finally:
+            self._instances.pop(loop, None)
+            await self.close()
+
+    async def post(self, path: str, payload: Dict[str, Union[str, bool, object]]) -> httpx.Response:
+        """
+        POST to the BankID API with the operation's timeouts, retries and circuit breaker.
+
+        @param path: The BankID API path.
+        @param payload: The JSON payload.
+        @return: The final response, 4xx and exhausted 5xx responses included.
+        @exception: Raises CircuitOpenError while BankID is considered unavailable.
+        """
+        probe = self.policy.breaker.before_call()
+        connect_timeout, read_timeout = self.policy.timeout(path)
+        timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.policy.record_call()
+        operation = operation_for(path)
+        try:
+            with observe_upstream_call(operation):
+                attempt = 0
+                while True:
+                    try:
+                        response = await self.client.post(path, json=payload, timeout=timeout)
+                    except httpx.HTTPError as e:
+                        record_upstream_error(operation, type(e).__name__)
+                        self.policy.breaker.record_failure(e)
+                        if not isinstance(e, httpx.TransportError) or not self.policy.should_retry(path, attempt):
+                            raise
+                    else:
+                        if response.status_code >= 400:
+                            record_upstream_error(operation, response.status_code)
+                        if response.status_code < 500:
+                            self.policy.breaker.record_success()
+                            return response
+                        self.policy.breaker.record_failure(f'{response.status_code} {response.reason_phrase}')
+                        if not self.policy.should_retry(path, attempt):
+                            return response
+
+                    await asyncio.sleep(self.policy.backoff(attempt))
+                    attempt += 1
+        finally:
+            # Any exit, cancellation included, frees the half-open probe slot.
+            if probe:
+                self.policy.breaker.end_probe()
+
+    async def close(self) -> None:
+        await self.client.aclose()
@@ -0,0 +1,173 @@
+import math
+import time
+import threading
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from authentication.services.bankid_order_store import get_order_store
+from typing import Dict, Optional, Tuple
+
+
+class AdmissionDenied(Exception):
+    """
+    Raised when a BankID initiate request is shed before reaching BankID.
+    """
+
+    def __init__(self, message: str, retry_after: int, reason: str) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class CacheRateLimit():
+    """
+    Token-bucket style limit shared by all worker processes through the cache.
+
+    A bucket of `burst` tokens refilling at `rate` tokens per second admits
+    about `burst` requests per `burst / rate` seconds. That is tracked as a
+    sliding window of two fixed-window counters, which only needs the atomic
+    add/incr every cache backend offers instead of a read-modify-write of the
+    bucket state. Requests are counted before they are checked, so the limit
+    holds under concurrent bursts.
+    """
+    KEY: str = 'bankid:admission:{name}:{window}'
+
+    def __init__(self, name: str, rate: float, burst: int) -> None:
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.window_seconds = burst / rate
+
+    def _keys(self, subject: str, now: float) -> Tuple[str, str, float]:
+        window = int(now // self.window_seconds)
+        elapsed = now - window * self.window_seconds
+        name = f'{self.name}:{subject}' if subject else self.name
+        return (
+            self.KEY.format(name=name, window=window - 1),
+            self.KEY.format(name=name, window=window),
+            elapsed / self.window_seconds,
+        )
+
+    def acquire(self, subject: str = '') -> float:
+        """
+        Take a token, counting the request before deciding on it.
+
+        The current window's counter is incremented first and the decision is
+        made on the value the increment returned, so concurrent requests each
+        see their own count and a burst cannot slip past a shared read. A
+        rejected request gives its token back.
+
+        @param subject: What the limit applies to, e.g. a client IP, or '' for a global limit.
+        @return: 0 if the request is admitted, otherwise the seconds to wait before retrying.
+        """
+        previous_key, current_key, progress = self._keys(subject, time.time())
+        timeout = math.ceil(self.window_seconds * 2) + 1
+        cache.add(current_key, 0, timeout=timeout)
+        try:
+            current = cache.incr(current_key)
+        except ValueError:
+            # The counter expired between add and incr, start it over.
+            cache.set(current_key, 1, timeout=timeout)
+            current = 1
+        used = cache.get(previous_key, 0) * (1 - progress) + current
+        if used <= self.burst:
+            return 0
+        self.release(subject, current_key)
+        return max(1.0, (used - self.burst) / self.rate)
+
+    def release(self, subject: str = '', key: Optional[str] = None) -> None:
+        """
+        Give back a token taken by acquire(), e.g. when another limit rejected the request.
+
+        @param subject: The subject passed to acquire().
+        @param key: The counter acquire() incremented, defaults to the current window's.
+        """
+        try:
+            cache.decr(key or self._keys(subject, time.time())[1])
+        except ValueError:
+            pass
+
+
+class BankIDAdmissionController():
+    """
+    Admission control in front of BankID initiate.
+
+    A request is admitted only if the number of open orders is below
+    max_open_orders and both its client IP's and the global rate limit have a
+    token left. Rejected requests give back the tokens they took, and are shed before any
+    upstream call or database write.
+    """
+    _instance: Optional['BankIDAdmissionController'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, ip_limit: CacheRateLimit, global_limit: CacheRateLimit, max_open_orders: int) -> None:
+        self.ip_limit = ip_limit
+        self.global_limit = global_limit
+        self.max_open_orders = max_open_orders
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {'open_orders': 0, 'client_rate': 0, 'global_rate': 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'BankIDAdmissionController':
+        """
+        Return the controller configured by the initiate_* settings in settings.BANKID.
+
+        @return: The process-wide BankIDAdmissionController.
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    bankid_settings = getattr(settings, 'BANKID', {})
+                    cls._instance = cls(
+                        ip_limit=CacheRateLimit(
+                            'ip',
+                            rate=float(bankid_settings.get('initiate_ip_rate') or 0.1),
+                            burst=int(bankid_settings.get('initiate_ip_burst') or 5)
+                        ),
+                        global_limit=CacheRateLimit(
+                            'global',
+                            rate=float(bankid_settings.get('initiate_global_rate') or 50),
+                            burst=int(bankid_settings.get('initiate_global_burst') or 200)
+                        ),
+                        max_open_orders=int(bankid_settings.get('max_open_orders') or 5000)
+                    )
+        return cls._instance
+
+    def _reject(self, reason: str, message: str, retry_after: float) -> None:
+        with self._lock:
+            self.rejected[reason] += 1
+        raise AdmissionDenied(message, retry_after=math.ceil(retry_after), reason=reason)
+
+    def admit(self, client_ip: str) -> None:
+        """
+        Admit an initiate request or shed it.
+
+        @param client_ip: The IP address of the client.
+        @exception: Raises AdmissionDenied with a retry hint if the request is shed.
+        """
+        if get_order_store().active_order_count() >= self.max_open_orders:
+            self._reject('open_orders', "Too many BankID logins are in progress, please try again shortly.", 2)
+
+        retry_after = self.ip_limit.acquire(client_ip)
+        if retry_after:
+            self._reject('client_rate', "Too many BankID login attempts, please try again later.", retry_after)
+
+        retry_after = self.global_limit.acquire()
+        if retry_after:
+            self.ip_limit.release(client_ip)
+            self._reject('global_rate', "Too many BankID logins are being started, please try again shortly.", retry_after)
+
+        with self._lock:
+            self.admitted += 1
+
+    async def aadmit(self, client_ip: str) -> None:
+        await sync_to_async(self.admit)(client_ip)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                'admitted': self.admitted,
+                'rejected': dict(self.rejected),
+                'max_open_orders': self.max_open_orders,
+            }
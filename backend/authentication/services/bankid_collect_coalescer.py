@@ -0,0 +1,209 @@
+import time
+import asyncio
+import threading
+from django.core.cache import cache
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+CollectResult = Dict[str, object]
+
+
+class _FlightAbandoned(Exception):
+    """
+    The task leading an asyncio flight was cancelled before the upstream call finished.
+    """
+
+
+class _Flight():
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result: Optional[CollectResult] = None
+        self.error: Optional[BaseException] = None
+
+
+class BankIDCollectCoalescer():
+    """
+    Single-flight coalescing of BankID collect calls per order reference.
+
+    Within a process, concurrent polls for the same order share one in-flight
+    upstream call. Across processes, the caller that wins a short lock in the
+    shared cache makes the call and publishes the result for result_ttl seconds;
+    the others wait for that result instead of calling BankID themselves, and
+    fall back to their own call if it does not show up within lock_timeout.
+
+    Failed calls are not cached, so an error is only shared with the callers
+    that were already waiting for it.
+    """
+    RESULT_KEY: str = 'bankid:collect:result:{order_ref}'
+    LOCK_KEY: str = 'bankid:collect:lock:{order_ref}'
+
+    def __init__(self, result_ttl: int = 1, lock_timeout: int = 6, wait_interval: float = 0.05) -> None:
+        self.result_ttl = result_ttl
+        self.lock_timeout = lock_timeout
+        self.wait_interval = wait_interval
+        self._flights: Dict[str, _Flight] = {}
+        self._async_flights: Dict[Tuple[asyncio.AbstractEventLoop, str], 'asyncio.Future[CollectResult]'] = {}
+        self._lock = threading.Lock()
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.shared_hits = 0
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def collect(self, order_ref: str, collect: Callable[[], CollectResult]) -> CollectResult:
+        """
+        Return the collect result for order_ref, calling BankID at most once per flight.
+
+        @param order_ref: The BankID order reference.
+        @param collect: Callable making the upstream collect call.
+        @return: The collect result shared by every concurrent caller.
+        @exception: Raises whatever the upstream call raised, to every caller waiting for it.
+        """
+        with self._lock:
+            flight = self._flights.get(order_ref)
+            if flight is None:
+                flight = self._flights[order_ref] = _Flight()
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None or flight.result is None:
+                raise flight.error or RuntimeError(f'Collect flight for {order_ref} ended without a result')
+            return flight.result
+
+        try:
+            flight.result = self._collect_shared(order_ref, collect)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[order_ref]
+            flight.event.set()
+
+    def _collect_shared(self, order_ref: str, collect: Callable[[], CollectResult]) -> CollectResult:
+        result_key = self.RESULT_KEY.format(order_ref=order_ref)
+        lock_key = self.LOCK_KEY.format(order_ref=order_ref)
+
+        result = cache.get(result_key)
+        if result is not None:
+            self._count('shared_hits')
+            return result
+
+        if not cache.add(lock_key, 1, timeout=self.lock_timeout):
+            # Another process is collecting this order, wait for it to publish the result.
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(self.wait_interval)
+                result = cache.get(result_key)
+                if result is not None:
+                    self._count('shared_hits')
+                    return result
+                if cache.get(lock_key) is None:
+                    break
+            return self._call(result_key, collect)
+
+        try:
+            return self._call(result_key, collect)
+        finally:
+            cache.delete(lock_key)
+
+    def _call(self, result_key: str, collect: Callable[[], CollectResult]) -> CollectResult:
+        self._count('upstream_calls')
+        result = collect()
+        cache.set(result_key, result, timeout=self.result_ttl)
+        return result
+
+    async def acollect(self, order_ref: str, collect: Callable[[], Awaitable[CollectResult]]) -> CollectResult:
+        """
+        Asyncio counterpart of collect(). Flights are shared between the tasks of one event loop.
+
+        @param order_ref: The BankID order reference.
+        @param collect: Coroutine function making the upstream collect call.
+        @return: The collect result shared by every concurrent caller.
+        @exception: Raises whatever the upstream call raised, to every caller waiting for it. A cancelled
+                    caller only cancels itself, the callers waiting on its flight retry.
+        """
+        loop = asyncio.get_running_loop()
+        key = (loop, order_ref)
+        while True:
+            future = self._async_flights.get(key)
+            if future is None:
+                break
+            self._count('coalesced')
+            try:
+                return await asyncio.shield(future)
+            except _FlightAbandoned:
+                # The leader was cancelled, not the call: retry, the first waiter to get here leads the next flight.
+                continue
+
+        future = self._async_flights[key] = loop.create_future()
+        try:
+            result = await self._acollect_shared(order_ref, collect)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.set_exception(_FlightAbandoned())
+            future.exception()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case no other task was waiting for it.
+            future.exception()
+            raise
+        finally:
+            del self._async_flights[key]
+
+    async def _acollect_shared(self, order_ref: str, collect: Callable[[], Awaitable[CollectResult]]) -> CollectResult:
+        result_key = self.RESULT_KEY.format(order_ref=order_ref)
+        lock_key = self.LOCK_KEY.format(order_ref=order_ref)
+
+        result = await cache.aget(result_key)
+        if result is not None:
+            self._count('shared_hits')
+            return result
+
+        if not await cache.aadd(lock_key, 1, timeout=self.lock_timeout):
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(self.wait_interval)
+                result = await cache.aget(result_key)
+                if result is not None:
+                    self._count('shared_hits')
+                    return result
+                if await cache.aget(lock_key) is None:
+                    break
+            return await self._acall(result_key, collect)
+
+        try:
+            return await self._acall(result_key, collect)
+        finally:
+            await cache.adelete(lock_key)
+
+    async def _acall(self, result_key: str, collect: Callable[[], Awaitable[CollectResult]]) -> CollectResult:
+        self._count('upstream_calls')
+        result = await collect()
+        await cache.aset(result_key, result, timeout=self.result_ttl)
+        return result
+
+    def forget(self, order_ref: str) -> None:
+        cache.delete(self.RESULT_KEY.format(order_ref=order_ref))
+
+    async def aforget(self, order_ref: str) -> None:
+        await cache.adelete(self.RESULT_KEY.format(order_ref=order_ref))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'in_flight': len(self._flights) + len(self._async_flights),
+                'upstream_calls': self.upstream_calls,
+                'coalesced': self.coalesced,
+                'shared_hits': self.shared_hits,
+            }
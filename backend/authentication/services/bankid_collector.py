@@ -0,0 +1,138 @@
+import time
+import uuid
+import logging
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from authentication.services.bankid_service import BankIDService
+from authentication.services.bankid_order_store import get_order_store
+from typing import Dict, List, Set
+
+logger = logging.getLogger(__name__)
+
+
+class BankIDCollector():
+    """
+    Background collector for all active BankID orders in the order store.
+
+    Every active order is collected once per interval (BankID recommends two
+    seconds) on a bounded worker pool, and the latest status is published to the
+    shared cache where the poll endpoint picks it up. Upstream call volume thus
+    follows the number of active orders, not how often clients poll.
+
+    Only one collector per deployment does upstream work: the others stand by
+    until the leader lease in the cache expires.
+    """
+    LEADER_KEY: str = 'bankid:collector:leader'
+
+    def __init__(self, max_workers: int = 8, interval: float = 2.0) -> None:
+        self.interval = interval
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bankid-collector')
+        self.identity = uuid.uuid4().hex
+        self.next_due: Dict[str, float] = {}
+        self.in_flight: Set[str] = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    @classmethod
+    def from_settings(cls) -> 'BankIDCollector':
+        return cls(
+            max_workers=int(settings.BANKID.get('collector_workers') or 8),
+            interval=float(settings.BANKID.get('collect_interval') or 2.0)
+        )
+
+    def is_leader(self) -> bool:
+        timeout = int(self.interval * 5) + 1
+        if cache.add(self.LEADER_KEY, self.identity, timeout=timeout):
+            return True
+        if cache.get(self.LEADER_KEY) == self.identity:
+            cache.touch(self.LEADER_KEY, timeout=timeout)
+            return True
+        return False
+
+    def active_order_refs(self) -> List[str]:
+        return get_order_store().active_order_refs()
+
+    def collect(self, order_ref: str) -> None:
+        try:
+            response_data = BankIDService().collect(order_ref)
+            BankIDService.publish_collected_status(order_ref, response_data, timeout=int(self.interval * 3) + 1)
+            if response_data.get('status') != 'pending':
+                with self.lock:
+                    self.next_due.pop(order_ref, None)
+        except requests.HTTPError as e:
+            # The order is unknown upstream, let the poll endpoint surface the error itself.
+            BankIDService.clear_collected_status(order_ref)
+            with self.lock:
+                self.next_due.pop(order_ref, None)
+            logger.warning('BankID collect for %s failed: %s', order_ref, e)
+        except Exception as e:
+            logger.warning('BankID collect for %s failed: %s', order_ref, e)
+        finally:
+            with self.lock:
+                self.in_flight.discard(order_ref)
+
+    def refresh_orders(self) -> None:
+        order_refs = set(self.active_order_refs())
+        now = time.monotonic()
+        with self.lock:
+            for order_ref in list(self.next_due):
+                if order_ref not in order_refs:
+                    del self.next_due[order_ref]
+            for order_ref in order_refs - self.next_due.keys():
+                # Spread new orders over the interval instead of collecting them in lockstep.
+                self.next_due[order_ref] = now + (hash(order_ref) % 1000) / 1000 * self.interval
+
+    def run_once(self) -> int:
+        """
+        Submit a collect for every tracked order that is due.
+
+        @return: The number of collects submitted.
+        """
+        now = time.monotonic()
+        submitted = 0
+        with self.lock:
+            due = [order_ref for order_ref, next_due in self.next_due.items()
+                   if next_due <= now and order_ref not in self.in_flight]
+            for order_ref in due:
+                self.next_due[order_ref] = now + self.interval
+                self.in_flight.add(order_ref)
+
+        for order_ref in due:
+            self.executor.submit(self.collect, order_ref)
+            submitted += 1
+
+        return submitted
+
+    def run_forever(self) -> None:
+        tick = self.interval / 10
+        last_refresh = 0.0
+        while not self.stop_event.is_set():
+            try:
+                if not self.is_leader():
+                    with self.lock:
+                        self.next_due.clear()
+                    self.stop_event.wait(self.interval)
+                    continue
+
+                if time.monotonic() - last_refresh >= self.interval:
+                    self.refresh_orders()
+                    last_refresh = time.monotonic()
+
+                self.run_once()
+            except Exception as e:
+                logger.exception('BankID collector loop failed: %s', e)
+            self.stop_event.wait(tick)
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.run_forever, name='bankid-collector', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        self.executor.shutdown(wait=False)
+        if cache.get(self.LEADER_KEY) == self.identity:
+            cache.delete(self.LEADER_KEY)
@@ -0,0 +1,158 @@
+import json
+import time
+import base64
+import httpx
+import asyncio
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import translation
+from authentication.services.bankid_service import BankIDService
+from authentication.services.async_bankid_service import AsyncBankIDService
+from authentication.services.bankid_resilience import CircuitOpenError
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
+
+
+QR_HINT_CODES = ('', 'outstandingTransaction', 'noClient')
+
+# The QR code changes once per second of order age, sample it twice as often.
+QR_SAMPLE_SECONDS: float = 0.5
+
+Status = Tuple[str, str, str]
+
+
+def format_event(event: str, data: Dict[str, object]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def qr_event(qr_image: bytes) -> str:
+    return format_event('qr', {'qr': f"data:image/svg+xml;base64,{base64.b64encode(qr_image).decode()}"})
+
+
+def collect_interval() -> float:
+    return float(settings.BANKID.get('collect_interval') or 2.0)
+
+
+def next_collect_at(result: Dict[str, object]) -> float:
+    poll_after = result.get('pollAfter')
+    return time.monotonic() + (float(poll_after) if isinstance(poll_after, (int, float)) else collect_interval())
+
+
+def result_status(result: Dict[str, object]) -> Status:
+    return (str(result['status']), str(result['hintCode']), str(result['message']))
+
+
+def status_event(status: Status) -> str:
+    return format_event('status', dict(zip(('status', 'hintCode', 'message'), status)))
+
+
+def wants_qr(last_status: Optional[Status]) -> bool:
+    # Once the code has been scanned the order no longer needs a QR code.
+    return last_status is None or last_status[1] in QR_HINT_CODES
+
+
+def bankid_event_stream(order_ref: str, language: Optional[str] = None) -> Iterator[str]:
+    """
+    Server-Sent Events for a single BankID order, for WSGI servers.
+
+    Emits a `qr` event whenever the animated QR code changes (once per second),
+    a `status` event whenever the status or hint code message changes, and ends
+    the stream with either `complete` (carrying the issued tokens) or `failed`.
+    WSGI servers only stream sync iterators, an async one is buffered until it
+    is exhausted.
+
+    @param order_ref: The BankID order reference.
+    @param language: Language used to render status messages.
+    @return: An iterator of encoded SSE frames.
+    """
+    bankid_service = BankIDService()
+    last_qr_data: Optional[str] = None
+    last_status: Optional[Status] = None
+    next_collect = 0.0
+
+    with translation.override(language or settings.LANGUAGE_CODE):
+        yield 'retry: 3000\n\n'
+
+        while True:
+            try:
+                if time.monotonic() >= next_collect:
+                    result = bankid_service.poll_authentication_status(order_ref)
+                    next_collect = next_collect_at(result)
+
+                    if 'access_token' in result:
+                        yield format_event('complete', result)
+                        return
+
+                    current_status = result_status(result)
+                    if current_status != last_status:
+                        last_status = current_status
+                        yield status_event(current_status)
+
+                if wants_qr(last_status):
+                    qr_data = bankid_service.generate_qr_code_data(order_ref=order_ref)
+                    if qr_data != last_qr_data:
+                        last_qr_data = qr_data
+                        yield qr_event(bankid_service.generate_qr_code_image(qr_data, format='svg'))
+            except ValueError as e:
+                yield format_event('failed', {'detail': str(e)})
+                return
+            except CircuitOpenError as e:
+                yield format_event('failed', {'detail': str(e)})
+                return
+            except requests.RequestException as e:
+                yield format_event('failed', {'detail': f"Failed to poll BankID authentication status: {str(e)}"})
+                return
+
+            time.sleep(QR_SAMPLE_SECONDS)
+
+
+async def abankid_event_stream(order_ref: str, language: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Server-Sent Events for a single BankID order, for ASGI servers.
+
+    Emits the same events as bankid_event_stream, awaiting BankID on the event loop.
+
+    @param order_ref: The BankID order reference.
+    @param language: Language used to render status messages.
+    @return: An async iterator of encoded SSE frames.
+    """
+    bankid_service = AsyncBankIDService()
+    last_qr_data: Optional[str] = None
+    last_status: Optional[Status] = None
+    next_collect = 0.0
+
+    with translation.override(language or settings.LANGUAGE_CODE):
+        yield 'retry: 3000\n\n'
+
+        while True:
+            try:
+                if time.monotonic() >= next_collect:
+                    result = await bankid_service.poll_authentication_status(order_ref)
+                    next_collect = next_collect_at(result)
+
+                    if 'access_token' in result:
+                        yield format_event('complete', result)
+                        return
+
+                    current_status = result_status(result)
+                    if current_status != last_status:
+                        last_status = current_status
+                        yield status_event(current_status)
+
+                if wants_qr(last_status):
+                    qr_data = await bankid_service.generate_qr_code_data(order_ref=order_ref)
+                    if qr_data != last_qr_data:
+                        last_qr_data = qr_data
+                        qr_image = await sync_to_async(bankid_service.generate_qr_code_image, thread_sensitive=False)(qr_data, format='svg')
+                        yield qr_event(qr_image)
+            except ValueError as e:
+                yield format_event('failed', {'detail': str(e)})
+                return
+            except CircuitOpenError as e:
+                yield format_event('failed', {'detail': str(e)})
+                return
+            except httpx.HTTPError as e:
+                yield format_event('failed', {'detail': f"Failed to poll BankID authentication status: {str(e)}"})
+                return
+
+            await asyncio.sleep(QR_SAMPLE_SECONDS)
@@ -0,0 +1,115 @@
+"""
+Prometheus metrics for the BankID integration.
+
+With gunicorn, set PROMETHEUS_MULTIPROC_DIR to an empty directory before the
+workers start. Every worker then writes its samples to memory-mapped files in
+that directory, and the metrics endpoint aggregates them, so a scrape sees the
+whole server no matter which worker answers it. gunicorn.conf.py cleans up
+after workers that exit.
+"""
+import os
+import time
+import ipaddress
+from contextlib import contextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+OPERATIONS: Tuple[str, ...] = ('auth', 'collect', 'cancel')
+
+UPSTREAM_DURATION = Histogram(
+    'bankid_upstream_request_duration_seconds',
+    'Duration of BankID RP API calls, retries included.',
+    ['operation'],
+    buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    'bankid_upstream_in_flight',
+    'BankID RP API calls in progress.',
+    ['operation'],
+    multiprocess_mode='livesum'
+)
+UPSTREAM_ERRORS = Counter(
+    'bankid_upstream_errors_total',
+    'Failed BankID RP API calls by HTTP status, or by exception for calls without a response.',
+    ['operation', 'status']
+)
+COLLECT_HINT_CODES = Counter(
+    'bankid_collect_hint_codes_total',
+    'Hint codes returned by BankID collect calls.',
+    ['status', 'hint_code']
+)
+ORDERS_TERMINAL = Counter(
+    'bankid_orders_terminal_total',
+    'BankID orders by terminal state.',
+    ['state', 'hint_code']
+)
+
+# Label lookups take a lock, so the per-operation children are resolved once.
+_DURATION: Dict[str, Histogram] = {operation: UPSTREAM_DURATION.labels(operation) for operation in OPERATIONS}
+_IN_FLIGHT: Dict[str, Gauge] = {operation: UPSTREAM_IN_FLIGHT.labels(operation) for operation in OPERATIONS}
+
+
+def operation_for(path: str) -> str:
+    return path.rsplit('/', 1)[-1]
+
+
+@contextmanager
+def observe_upstream_call(operation: str) -> Iterator[None]:
+    """
+    Time a BankID call and count it as in flight while it runs.
+
+    @param operation: auth, collect or cancel.
+    """
+    duration = _DURATION.get(operation) or UPSTREAM_DURATION.labels(operation)
+    in_flight = _IN_FLIGHT.get(operation) or UPSTREAM_IN_FLIGHT.labels(operation)
+    in_flight.inc()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration.observe(time.perf_counter() - started)
+        in_flight.dec()
+
+
+def record_upstream_error(operation: str, status: object) -> None:
+    UPSTREAM_ERRORS.labels(operation, str(status)).inc()
+
+
+def record_collect(status: str, hint_code: str) -> None:
+    COLLECT_HINT_CODES.labels(status, hint_code or '').inc()
+
+
+def record_terminal_state(state: str, hint_code: Optional[str] = '') -> None:
+    ORDERS_TERMINAL.labels(state, hint_code or '').inc()
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    @return: The metrics in Prometheus text format, aggregated over all workers in multiprocess mode, and their content type.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def allowed_networks(allowed_ips: Optional[str]) -> List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]:
+    return [ipaddress.ip_network(network.strip(), strict=False) for network in (allowed_ips or '').split(',') if network.strip()]
+
+
+def may_scrape(remote_addr: Optional[str], allowed_ips: Optional[str]) -> bool:
+    """
+    Whether a client may read the metrics. They reveal traffic and error rates, so only
+    the scraper's addresses are let through.
+
+    @param remote_addr: The client address, REMOTE_ADDR.
+    @param allowed_ips: Comma separated addresses or networks, e.g. "127.0.0.1,10.0.0.0/8".
+    @return: True if remote_addr is in one of the allowed networks.
+    """
+    try:
+        address = ipaddress.ip_address(remote_addr or '')
+    except ValueError:
+        return False
+    return any(address in network for network in allowed_networks(allowed_ips))
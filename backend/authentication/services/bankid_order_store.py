@@ -0,0 +1,371 @@
+import abc
+import math
+import time
+import struct
+import datetime
+import threading
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from typing import Dict, List, Optional, Tuple
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class BankIDOrder():
+    """
+    Ephemeral state of a pending BankID order.
+
+    Orders are written to the shared cache in a fixed, versioned binary layout
+    rather than pickled, see to_bytes().
+    """
+    __slots__ = ('order_ref', 'auto_start_token', 'qr_start_token', 'qr_auth_codes', 'created_at')
+
+    SCHEMA_VERSION: int = 1
+    # Schema version, created_at in microseconds since the epoch and the byte
+    # lengths of order_ref, auto_start_token and qr_start_token, all big-endian.
+    HEADER = struct.Struct('!BqHHH')
+
+    def __init__(self, order_ref: str, auto_start_token: str, qr_start_token: str, qr_auth_codes: bytes, created_at: datetime.datetime) -> None:
+        self.order_ref = order_ref
+        self.auto_start_token = auto_start_token
+        self.qr_start_token = qr_start_token
+        self.qr_auth_codes = qr_auth_codes
+        self.created_at = created_at
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, BankIDOrder):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"BankIDOrder(order_ref={self.order_ref!r}, created_at={self.created_at.isoformat()})"
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize the order: the header, then the three UTF-8 strings, then the QR auth codes.
+
+        @return: The encoded order.
+        """
+        order_ref = self.order_ref.encode()
+        auto_start_token = self.auto_start_token.encode()
+        qr_start_token = self.qr_start_token.encode()
+        created_at = (self.created_at - EPOCH) // datetime.timedelta(microseconds=1)
+        return b''.join((
+            self.HEADER.pack(self.SCHEMA_VERSION, created_at, len(order_ref), len(auto_start_token), len(qr_start_token)),
+            order_ref,
+            auto_start_token,
+            qr_start_token,
+            self.qr_auth_codes,
+        ))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'BankIDOrder':
+        """
+        Deserialize an order written by to_bytes().
+
+        @param data: The encoded order.
+        @return: The decoded BankIDOrder.
+        @exception: Raises ValueError if the data is malformed or of another schema version.
+        """
+        try:
+            version, created_at, order_ref_size, auto_start_token_size, qr_start_token_size = cls.HEADER.unpack_from(data)
+        except struct.error as e:
+            raise ValueError(f'Malformed BankID order: {e}')
+        if version != cls.SCHEMA_VERSION:
+            raise ValueError(f'Unsupported BankID order schema version: {version}')
+
+        view = memoryview(data)
+        offset = cls.HEADER.size
+        fields: List[str] = []
+        for size in (order_ref_size, auto_start_token_size, qr_start_token_size):
+            fields.append(str(view[offset:offset + size], 'utf-8'))
+            offset += size
+
+        return cls(
+            order_ref=fields[0],
+            auto_start_token=fields[1],
+            qr_start_token=fields[2],
+            qr_auth_codes=bytes(view[offset:]),
+            created_at=EPOCH + datetime.timedelta(microseconds=created_at)
+        )
+
+
+class BankIDOrderStore(abc.ABC):
+    """
+    Order-state store with native TTLs, so short-lived login state never touches the primary database.
+    """
+    ORDER_TTL_SECONDS: int = 180
+    COMPLETION_TTL_SECONDS: int = 30
+
+    @abc.abstractmethod
+    def save(self, order: BankIDOrder, timeout: int = ORDER_TTL_SECONDS) -> None:
+        """
+        Store a new order.
+
+        @param order: The order BankID has just started.
+        @param timeout: Seconds to keep the order.
+        """
+
+    @abc.abstractmethod
+    def get(self, order_ref: str) -> Optional[BankIDOrder]:
+        """
+        @param order_ref: The BankID order reference.
+        @return: The order, or None if it is unknown or has expired.
+        """
+
+    @abc.abstractmethod
+    def delete(self, order_ref: str) -> bool:
+        """
+        Remove an order.
+
+        @param order_ref: The BankID order reference.
+        @return: True if the order existed, which is only the case for one concurrent caller.
+        """
+
+    @abc.abstractmethod
+    def active_order_refs(self) -> List[str]:
+        """
+        @return: The references of the orders that have been saved and neither deleted nor expired.
+        """
+
+    def active_order_count(self) -> int:
+        return len(self.active_order_refs())
+
+    @abc.abstractmethod
+    def save_completion(self, order_ref: str, tokens: Dict[str, str], timeout: int = COMPLETION_TTL_SECONDS) -> None:
+        """
+        Remember the tokens issued for a completed order, so repeated polls get the same result.
+
+        @param order_ref: The BankID order reference.
+        @param tokens: The access_token and refresh_token issued for the order.
+        @param timeout: Seconds to keep the tokens.
+        """
+
+    @abc.abstractmethod
+    def get_completion(self, order_ref: str) -> Optional[Dict[str, str]]:
+        """
+        @param order_ref: The BankID order reference.
+        @return: The tokens saved by save_completion, or None.
+        """
+
+    async def asave(self, order: BankIDOrder, timeout: int = ORDER_TTL_SECONDS) -> None:
+        await sync_to_async(self.save)(order, timeout)
+
+    async def aget(self, order_ref: str) -> Optional[BankIDOrder]:
+        return await sync_to_async(self.get)(order_ref)
+
+    async def adelete(self, order_ref: str) -> bool:
+        return await sync_to_async(self.delete)(order_ref)
+
+    async def asave_completion(self, order_ref: str, tokens: Dict[str, str], timeout: int = COMPLETION_TTL_SECONDS) -> None:
+        await sync_to_async(self.save_completion)(order_ref, tokens, timeout)
+
+    async def aget_completion(self, order_ref: str) -> Optional[Dict[str, str]]:
+        return await sync_to_async(self.get_completion)(order_ref)
+
+
+class InMemoryBankIDOrderStore(BankIDOrderStore):
+    """
+    Process-local store, for single process deployments and development.
+    """
+
+    def __init__(self) -> None:
+        self._orders: Dict[str, Tuple[float, BankIDOrder]] = {}
+        self._completions: Dict[str, Tuple[float, Dict[str, str]]] = {}
+        self._lock = threading.Lock()
+
+    def save(self, order: BankIDOrder, timeout: int = BankIDOrderStore.ORDER_TTL_SECONDS) -> None:
+        with self._lock:
+            self._orders[order.order_ref] = (time.monotonic() + timeout, order)
+
+    def get(self, order_ref: str) -> Optional[BankIDOrder]:
+        entry = self._orders.get(order_ref)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self.delete(order_ref)
+            return None
+        return entry[1]
+
+    def delete(self, order_ref: str) -> bool:
+        with self._lock:
+            entry = self._orders.pop(order_ref, None)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def active_order_refs(self) -> List[str]:
+        now = time.monotonic()
+        with self._lock:
+            for order_ref in [order_ref for order_ref, (expires_at, _) in self._orders.items() if expires_at <= now]:
+                del self._orders[order_ref]
+            return list(self._orders)
+
+    def save_completion(self, order_ref: str, tokens: Dict[str, str], timeout: int = BankIDOrderStore.COMPLETION_TTL_SECONDS) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for expired in [ref for ref, (expires_at, _) in self._completions.items() if expires_at <= now]:
+                del self._completions[expired]
+            self._completions[order_ref] = (now + timeout, tokens)
+
+    def get_completion(self, order_ref: str) -> Optional[Dict[str, str]]:
+        entry = self._completions.get(order_ref)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    async def asave(self, order: BankIDOrder, timeout: int = BankIDOrderStore.ORDER_TTL_SECONDS) -> None:
+        self.save(order, timeout)
+
+    async def aget(self, order_ref: str) -> Optional[BankIDOrder]:
+        return self.get(order_ref)
+
+    async def adelete(self, order_ref: str) -> bool:
+        return self.delete(order_ref)
+
+    async def asave_completion(self, order_ref: str, tokens: Dict[str, str], timeout: int = BankIDOrderStore.COMPLETION_TTL_SECONDS) -> None:
+        self.save_completion(order_ref, tokens, timeout)
+
+    async def aget_completion(self, order_ref: str) -> Optional[Dict[str, str]]:
+        return self.get_completion(order_ref)
+
+
+class CacheBankIDOrderStore(BankIDOrderStore):
+    """
+    Store shared by all worker processes, backed by a Django cache.
+
+    Orders are stored in their compact binary form, and entries of another
+    schema version are treated as missing.
+
+    The background collector finds active orders through slots instead of a
+    shared index that every save would rewrite. Time is cut into buckets of
+    BUCKET_SECONDS. A new order takes the next slot of the current bucket
+    from an atomic counter, and its reference is written to that slot's own
+    key. Deleting the order frees the slot and counts the bucket's ended
+    orders. Bucket keys expire once no order of the bucket can still be
+    alive, so nothing needs cleaning up. The cache should increment
+    atomically (memcached, redis or locmem), or concurrent saves can take the
+    same slot.
+    """
+    ORDER_KEY: str = 'bankid:order:{order_ref}'
+    POSITION_KEY: str = 'bankid:order:{order_ref}:slot'
+    BUCKET_SIZE_KEY: str = 'bankid:orders:{bucket}:size'
+    BUCKET_ENDED_KEY: str = 'bankid:orders:{bucket}:ended'
+    SLOT_KEY: str = 'bankid:orders:{bucket}:{slot}'
+    COMPLETION_KEY: str = 'bankid:completion:{order_ref}'
+    BUCKET_SECONDS: int = 10
+    GET_MANY_CHUNK_SIZE: int = 1000
+
+    def __init__(self, alias: str = 'default') -> None:
+        self.cache = caches[alias]
+
+    def _incr(self, key: str, timeout: int) -> int:
+        self.cache.add(key, 0, timeout=timeout)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # The key expired between add and incr.
+            self.cache.set(key, 1, timeout=timeout)
+            return 1
+
+    def _live_buckets(self) -> range:
+        bucket = int(time.time()) // self.BUCKET_SECONDS
+        return range(bucket - math.ceil(self.ORDER_TTL_SECONDS / self.BUCKET_SECONDS), bucket + 1)
+
+    def save(self, order: BankIDOrder, timeout: int = BankIDOrderStore.ORDER_TTL_SECONDS) -> None:
+        bucket = int(time.time()) // self.BUCKET_SECONDS
+        slot = self._incr(self.BUCKET_SIZE_KEY.format(bucket=bucket), timeout=timeout + self.BUCKET_SECONDS)
+        self.cache.set_many({
+            self.ORDER_KEY.format(order_ref=order.order_ref): order.to_bytes(),
+            self.POSITION_KEY.format(order_ref=order.order_ref): (bucket, slot),
+            self.SLOT_KEY.format(bucket=bucket, slot=slot): order.order_ref,
+        }, timeout=timeout)
+
+    def _decode(self, data: Optional[bytes]) -> Optional[BankIDOrder]:
+        if data is None:
+            return None
+        try:
+            return BankIDOrder.from_bytes(data)
+        except (TypeError, ValueError):
+            return None
+
+    def get(self, order_ref: str) -> Optional[BankIDOrder]:
+        return self._decode(self.cache.get(self.ORDER_KEY.format(order_ref=order_ref)))
+
+    def delete(self, order_ref: str) -> bool:
+        deleted = self.cache.delete(self.ORDER_KEY.format(order_ref=order_ref))
+        if deleted:
+            position_key = self.POSITION_KEY.format(order_ref=order_ref)
+            position: Optional[Tuple[int, int]] = self.cache.get(position_key)
+            if position is not None:
+                bucket, slot = position
+                self.cache.delete_many([position_key, self.SLOT_KEY.format(bucket=bucket, slot=slot)])
+                self._incr(self.BUCKET_ENDED_KEY.format(bucket=bucket), timeout=self.ORDER_TTL_SECONDS + self.BUCKET_SECONDS)
+        return bool(deleted)
+
+    def active_order_refs(self) -> List[str]:
+        buckets = self._live_buckets()
+        sizes: Dict[str, int] = self.cache.get_many([self.BUCKET_SIZE_KEY.format(bucket=bucket) for bucket in buckets])
+        slot_keys = [
+            self.SLOT_KEY.format(bucket=bucket, slot=slot)
+            for bucket in buckets
+            for slot in range(1, sizes.get(self.BUCKET_SIZE_KEY.format(bucket=bucket), 0) + 1)
+        ]
+        order_refs: Dict[str, None] = {}
+        for start in range(0, len(slot_keys), self.GET_MANY_CHUNK_SIZE):
+            order_refs.update(dict.fromkeys(self.cache.get_many(slot_keys[start:start + self.GET_MANY_CHUNK_SIZE]).values()))
+        return list(order_refs)
+
+    def active_order_count(self) -> int:
+        """
+        Count the open orders from the bucket counters, without reading any slot.
+
+        Abandoned orders are counted until their bucket expires, at most
+        BUCKET_SECONDS after the orders themselves.
+        """
+        buckets = self._live_buckets()
+        counters: Dict[str, int] = self.cache.get_many(
+            [self.BUCKET_SIZE_KEY.format(bucket=bucket) for bucket in buckets]
+            + [self.BUCKET_ENDED_KEY.format(bucket=bucket) for bucket in buckets]
+        )
+        return sum(
+            max(counters.get(self.BUCKET_SIZE_KEY.format(bucket=bucket), 0) - counters.get(self.BUCKET_ENDED_KEY.format(bucket=bucket), 0), 0)
+            for bucket in buckets
+        )
+
+    def save_completion(self, order_ref: str, tokens: Dict[str, str], timeout: int = BankIDOrderStore.COMPLETION_TTL_SECONDS) -> None:
+        self.cache.set(self.COMPLETION_KEY.format(order_ref=order_ref), tokens, timeout=timeout)
+
+    def get_completion(self, order_ref: str) -> Optional[Dict[str, str]]:
+        return self.cache.get(self.COMPLETION_KEY.format(order_ref=order_ref))
+
+    async def aget(self, order_ref: str) -> Optional[BankIDOrder]:
+        return self._decode(await self.cache.aget(self.ORDER_KEY.format(order_ref=order_ref)))
+
+    async def asave_completion(self, order_ref: str, tokens: Dict[str, str], timeout: int = BankIDOrderStore.COMPLETION_TTL_SECONDS) -> None:
+        await self.cache.aset(self.COMPLETION_KEY.format(order_ref=order_ref), tokens, timeout=timeout)
+
+    async def aget_completion(self, order_ref: str) -> Optional[Dict[str, str]]:
+        return await self.cache.aget(self.COMPLETION_KEY.format(order_ref=order_ref))
+
+
+_order_store: Optional[BankIDOrderStore] = None
+_order_store_lock = threading.Lock()
+
+
+def get_order_store() -> BankIDOrderStore:
+    """
+    Return the process-wide order store configured by BANKID['order_store'].
+
+    'memory' keeps orders in this process only, anything else is taken as the
+    alias of the Django cache to share orders through.
+    """
+    global _order_store
+    if _order_store is None:
+        with _order_store_lock:
+            if _order_store is None:
+                backend = settings.BANKID.get('order_store') or 'default'
+                if backend == 'memory':
+                    _order_store = InMemoryBankIDOrderStore()
+                else:
+                    _order_store = CacheBankIDOrderStore(alias=backend)
+    return _order_store
@@ -0,0 +1,62 @@
+import json
+import threading
+from django.conf import settings
+from django.utils import translation
+from authentication.services.bankid_service import BankIDServiceBase
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class PollResponseBodies():
+    """
+    Ready-to-send JSON bodies of pending poll results.
+
+    A pending result only depends on its status, hint code and the active
+    language, apart from the poll delay, so every combination is rendered once
+    and the poll endpoint just appends the delay to the stored bytes. The
+    encoding matches JSONRenderer: compact separators, UTF-8.
+    """
+    _instance: Optional['PollResponseBodies'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, languages: Iterable[str]) -> None:
+        self._prefixes: Dict[Tuple[str, str, str], bytes] = {}
+        self._lock = threading.Lock()
+        for language in languages:
+            for hint_code in ('', *BankIDServiceBase.HINT_CODE_TO_RFA):
+                self._prefix('pending', hint_code, language)
+
+    @classmethod
+    def get_instance(cls) -> 'PollResponseBodies':
+        """
+        Return the table for settings.LANGUAGES, rendering it on first use.
+
+        @return: The process-wide PollResponseBodies.
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls(languages=[code for code, _name in settings.LANGUAGES])
+        return cls._instance
+
+    def _prefix(self, status: str, hint_code: str, language: str) -> bytes:
+        key = (status, hint_code, language)
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            # Hint codes BankID added after this table was written are rendered on first sight.
+            with translation.override(language):
+                result = BankIDServiceBase._pending_result(status, hint_code)
+                result['message'] = str(result['message'])
+            prefix = json.dumps(result, ensure_ascii=False, separators=(',', ':')).encode()[:-1]
+            with self._lock:
+                self._prefixes[key] = prefix
+        return prefix
+
+    def body(self, status: str, hint_code: str, language: str, poll_after: int) -> bytes:
+        """
+        @param status: The order status, normally 'pending'.
+        @param hint_code: The BankID hint code.
+        @param language: The language to render the message in.
+        @param poll_after: Seconds until the client should poll again.
+        @return: The JSON body of the poll response.
+        """
+        return self._prefix(status, hint_code, language) + b',"pollAfter":%d}' % poll_after
@@ -0,0 +1,237 @@
+import time
+import random
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple, Union
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling BankID while the circuit breaker is open.
+    """
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker():
+    """
+    Error-rate circuit breaker over a sliding time window.
+
+    Opens once at least min_calls calls were made in the window and the share of
+    failures reaches error_threshold. While open, calls fail fast with the last
+    upstream error. After open_seconds a single probe call is let through
+    (half-open), and its outcome closes or re-opens the breaker.
+    """
+    CLOSED: str = 'closed'
+    OPEN: str = 'open'
+    HALF_OPEN: str = 'half_open'
+
+    def __init__(self, error_threshold: float = 0.5, min_calls: int = 20, window_seconds: float = 30.0, open_seconds: float = 15.0) -> None:
+        self.error_threshold = error_threshold
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.last_error: Optional[str] = None
+        self.times_opened = 0
+        self.rejected_calls = 0
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float) -> None:
+        while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+            self._outcomes.popleft()
+
+    def before_call(self) -> bool:
+        """
+        Let a call through or reject it.
+
+        @return: True if the call is the half-open probe, its caller must then call end_probe() once it is done.
+        @exception: Raises CircuitOpenError while the breaker is open or another probe is in flight.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return False
+            retry_after = self.opened_at + self.open_seconds - time.monotonic()
+            if self.state == self.OPEN and retry_after <= 0:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected_calls += 1
+            raise CircuitOpenError(
+                f"BankID is currently unavailable: {self.last_error}",
+                retry_after=max(retry_after, 1.0)
+            )
+
+    def end_probe(self) -> None:
+        """
+        Release the probe slot, also when the probe ended without an outcome (e.g. it was cancelled),
+        so that the next call probes again.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._outcomes.append((now, True))
+            self._trim(now)
+            if self.state == self.HALF_OPEN:
+                self.state = self.CLOSED
+                self._outcomes.clear()
+            self._probe_in_flight = False
+
+    def record_failure(self, error: Union[Exception, str]) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self.last_error = str(error)
+            self._outcomes.append((now, False))
+            self._trim(now)
+            failures = sum(1 for _, success in self._outcomes if not success)
+            if self.state == self.HALF_OPEN or (
+                    len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.error_threshold):
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = now
+            self._probe_in_flight = False
+
+    def retry_after(self) -> float:
+        """
+        @return: Seconds until an open breaker lets a probe through, 0 when it is closed.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return 0.0
+            return max(self.opened_at + self.open_seconds - time.monotonic(), 0.0)
+
+    def error_rate(self) -> float:
+        """
+        @return: The share of failed calls in the window, 0 while fewer than min_calls were made.
+        """
+        with self._lock:
+            self._trim(time.monotonic())
+            if len(self._outcomes) < self.min_calls:
+                return 0.0
+            return sum(1 for _, success in self._outcomes if not success) / len(self._outcomes)
+
+    def stats(self) -> Dict[str, Union[str, int, float, None]]:
+        with self._lock:
+            self._trim(time.monotonic())
+            failures = sum(1 for _, success in self._outcomes if not success)
+            return {
+                'state': self.state,
+                'window_calls': len(self._outcomes),
+                'window_failures': failures,
+                'times_opened': self.times_opened,
+                'rejected_calls': self.rejected_calls,
+                'last_error': self.last_error,
+            }
+
+
+class BankIDResiliencePolicy():
+    """
+    Per-operation timeouts, a bounded retry budget with jittered exponential
+    backoff for idempotent operations, and the circuit breaker guarding BankID.
+    """
+    DEFAULT_TIMEOUTS: Dict[str, Tuple[float, float]] = {
+        '/rp/v6.0/auth': (3.05, 10.0),
+        '/rp/v6.0/collect': (3.05, 5.0),
+        '/rp/v6.0/cancel': (3.05, 5.0),
+    }
+    IDEMPOTENT_PATHS: Tuple[str, ...] = ('/rp/v6.0/collect', '/rp/v6.0/cancel')
+
+    _instance: Optional['BankIDResiliencePolicy'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_retries: int = 2, backoff_base: float = 0.1, backoff_max: float = 1.0,
+                 retry_budget_ratio: float = 0.1, retry_budget_min: int = 10,
+                 breaker: Optional[CircuitBreaker] = None) -> None:
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_budget_ratio = retry_budget_ratio
+        self.retry_budget_min = retry_budget_min
+        self.breaker = breaker or CircuitBreaker()
+        self.calls = 0
+        self.retries = 0
+        self.retries_denied = 0
+        self._budget_window: Deque[Tuple[float, bool]] = deque()
+        self._window_calls = 0
+        self._window_retries = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'BankIDResiliencePolicy':
+        """
+        Return the process-wide policy shared by the sync and async transports.
+
+        @return: The shared BankIDResiliencePolicy.
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def timeout(self, path: str) -> Tuple[float, float]:
+        return self.DEFAULT_TIMEOUTS.get(path, (3.05, 10.0))
+
+    def _trim_budget_window(self, now: float) -> None:
+        while self._budget_window and self._budget_window[0][0] < now - self.breaker.window_seconds:
+            _, is_retry = self._budget_window.popleft()
+            if is_retry:
+                self._window_retries -= 1
+            else:
+                self._window_calls -= 1
+
+    def record_call(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self.calls += 1
+            self._budget_window.append((now, False))
+            self._window_calls += 1
+            self._trim_budget_window(now)
+
+    def should_retry(self, path: str, attempt: int) -> bool:
+        """
+        Decide whether a failed call may be retried.
+
+        Retries are limited per call (max_retries) and overall to retry_budget_ratio
+        of the calls in the breaker window, so retries cannot multiply load during
+        an upstream brownout.
+
+        @param path: The BankID API path that failed.
+        @param attempt: Number of retries already made for this call.
+        @return: True if the call should be retried.
+        """
+        if path not in self.IDEMPOTENT_PATHS or attempt >= self.max_retries:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._trim_budget_window(now)
+            if self._window_retries >= max(self.retry_budget_min, self._window_calls * self.retry_budget_ratio):
+                self.retries_denied += 1
+                return False
+            self.retries += 1
+            self._budget_window.append((now, True))
+            self._window_retries += 1
+            return True
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter: a random delay up to the capped exponential backoff.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'retries': self.retries,
+                'retries_denied': self.retries_denied,
+                'breaker': self.breaker.stats(),
+            }
@@ -1,5 +1,7 @@
 import io
 import hmac
+import math
+import time
 import qrcode
 import hashlib
 import requests
@@ -8,16 +10,44 @@ from authentication.jwt_authentication import JWTAuthentication
 from authentication.models import User
 from requests.models import Response
 from django.core.cache import cache
+from django.db import transaction
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
-from authentication.models import BankIDAuthentication
-from typing import Dict, Union
-from django.core.exceptions import ObjectDoesNotExist
-from authentication.models import BankIDAuthentication
-import requests_pkcs12
+from typing import Callable, Dict, List, Optional, Union
+from authentication.services.bankid_transport import BankIDTransport
+from authentication.services.bankid_resilience import BankIDResiliencePolicy
+from authentication.services.qr_image_cache import QRImageCache
+from authentication.services.bankid_collect_coalescer import BankIDCollectCoalescer
+from authentication.services.bankid_order_store import BankIDOrder, get_order_store
+from authentication.services.bankid_metrics import record_collect, record_terminal_state
+
+
+def issue_tokens(personal_number: str) -> Dict[str, str]:
+    """
+    Look up the user BankID identified and issue their tokens, in a single transaction.
+
+    @param personal_number: The personal number BankID identified.
+    @return: A dict with access_token and refresh_token.
+    @exception: Raises ValueError if no user has the personal number.
+    """
+    try:
+        with transaction.atomic():
+            user = User.objects.only('id', 'account_id', 'is_superuser', 'permissions_version').get(personal_number=personal_number)
+            return {
+                'access_token': JWTAuthentication.generate_jwt(user),
+                'refresh_token': JWTAuthentication.generate_refresh_token(user)
+            }
+    except User.DoesNotExist:
+        record_terminal_state('unknown_user')
+        raise ValueError(
+            _('It does not seem you have an account associated with your personal number.'))
 
 
-class BankIDService():
+class BankIDServiceBase():
+    """
+    BankID logic shared by BankIDService and AsyncBankIDService that does no I/O:
+    user messages, request payloads, the order record, QR codes and poll results.
+    """
     RFA: dict[int, str] = {
         1: _("Please start the BankID app."),
         2: _("The BankID app is not installed. Please contact your bank."),
@@ -58,20 +88,31 @@ class BankIDService():
         'success': 21,
     }
 
-    def __init__(self) -> None:
-        self.bankid_url = settings.BANKID['endpoint']
-        self.pkcs12_file = settings.BANKID['p12_cert_path']
-        self.pkcs12_password = settings.BANKID['p12_password']
-        self.verify = settings.BANKID['ca_cert_path']
+    # Seconds a client should wait before polling again, per hint code. During
+    # outstandingTransaction nothing happens until the user acts, while userSign
+    # means the order is about to complete.
+    POLL_DELAYS: dict[str, int] = {
+        'outstandingTransaction': 3,
+        'noClient': 3,
+        'started': 2,
+        'userMrtd': 2,
+        'userCallConfirm': 2,
+        'userSign': 1,
+    }
+    DEFAULT_POLL_DELAY: int = 2
+    MAX_POLL_DELAY: int = 10
 
-    def _request(self, path: str, payload: Dict[str, Union[str, bool, object]]) -> Response:
-        return requests_pkcs12.post(
-            f'{self.bankid_url}{path}',
-            json=payload,
-            pkcs12_filename=self.pkcs12_file,
-            pkcs12_password=self.pkcs12_password,
-            verify=self.verify
-        )
+    COLLECTED_STATUS_KEY: str = 'bankid:status:{order_ref}'
+    COMPLETION_WAIT_SECONDS: float = 2.0
+    COMPLETION_WAIT_INTERVAL: float = 0.05
+
+    QR_VALIDITY_SECONDS: int = 30
+    QR_AUTH_CODE_SIZE: int = hashlib.sha256().digest_size
+
+    QR_IMAGE_CACHE: QRImageCache = QRImageCache()
+    COLLECT_COALESCER: BankIDCollectCoalescer = BankIDCollectCoalescer()
+
+    policy: BankIDResiliencePolicy
 
     def get_rfa_message(self, index: int) -> str:
         return self.RFA[index]
@@ -79,29 +120,288 @@ class BankIDService():
     def get_default_rfa_message(self, status: str) -> str:
         return self.get_rfa_message(self.DEFAULT_HINT_CODES[status])
 
+    @classmethod
+    def collected_status(cls, response_data: Dict[str, object]) -> Dict[str, object]:
+        """
+        Trim a collect response to the fields the poll endpoint needs before it is shared.
+
+        @param response_data: The collect response.
+        @return: The status, hintCode and, on completion, the personal number.
+        """
+        status: Dict[str, object] = {
+            'status': response_data.get('status'),
+            'hintCode': response_data.get('hintCode', ''),
+        }
+        personal_number = cls._completion_personal_number(response_data)
+        if personal_number:
+            status['completionData'] = {'user': {'personalNumber': personal_number}}
+        return status
+
+    def _auth_payload(self, end_user_ip: str) -> Dict[str, Union[str, bool, object]]:
+        return {
+            'endUserIp': end_user_ip,
+            'returnRisk': True,
+            'requirement': {
+                'risk': 'low'
+            },
+        }
+
+    def _order_age(self, order: BankIDOrder) -> float:
+        return (datetime.datetime.now(datetime.timezone.utc) - order.created_at).total_seconds()
+
+    def _qr_auth_codes(self, qr_start_secret: str) -> bytes:
+        """
+        Precompute the QR auth code for every second of the QR validity window.
+
+        @param qr_start_secret: The qrStartSecret of the order.
+        @return: The raw HMAC-SHA256 digests concatenated, 32 bytes per second.
+        """
+        key = qr_start_secret.encode()
+        return b''.join(
+            hmac.new(key=key, msg=str(second).encode(), digestmod=hashlib.sha256).digest()
+            for second in range(self.QR_VALIDITY_SECONDS + 1)
+        )
+
+    def _order(self, response_data: Dict[str, str]) -> BankIDOrder:
+        return BankIDOrder(
+            order_ref=response_data['orderRef'],
+            auto_start_token=response_data['autoStartToken'],
+            qr_start_token=response_data['qrStartToken'],
+            qr_auth_codes=self._qr_auth_codes(response_data['qrStartSecret']),
+            created_at=datetime.datetime.now(datetime.timezone.utc)
+        )
+
+    def _qr_code_data(self, order: BankIDOrder) -> str:
+        current_time = int(self._order_age(order))
+        offset = current_time * self.QR_AUTH_CODE_SIZE
+        qr_auth_code = order.qr_auth_codes[offset:offset + self.QR_AUTH_CODE_SIZE].hex()
+
+        return f"bankid.{order.qr_start_token}.{current_time}.{qr_auth_code}"
+
+    @classmethod
+    def _pending_result(cls, status: str, hint_code: str) -> Dict[str, Union[str, object]]:
+        return {
+            'status': status,
+            'hintCode': hint_code,
+            'message': cls.RFA[cls.HINT_CODE_TO_RFA.get(
+                hint_code, cls.DEFAULT_HINT_CODES[status])]
+        }
+
+    @classmethod
+    def _failed_message(cls, hint_code: str) -> str:
+        return cls.RFA[cls.HINT_CODE_TO_RFA.get(hint_code, cls.DEFAULT_HINT_CODES['failed'])]
+
+    def next_poll_delay(self, hint_code: str, order: Optional[BankIDOrder]) -> int:
+        """
+        Choose how long a client should wait before polling a pending order again.
+
+        Orders still waiting for the user back off further every QR validity
+        period, and while BankID is failing clients wait out the circuit breaker
+        instead of polling into it.
+
+        @param hint_code: The hint code of the pending order.
+        @param order: The order, if it is still in the order store.
+        @return: The delay in whole seconds.
+        """
+        delay = self.POLL_DELAYS.get(hint_code, self.DEFAULT_POLL_DELAY)
+        if order is not None and hint_code in ('outstandingTransaction', 'noClient'):
+            delay *= 1 + int(self._order_age(order)) // self.QR_VALIDITY_SECONDS
+
+        breaker = self.policy.breaker
+        if breaker.error_rate() >= breaker.error_threshold / 2:
+            delay *= 2
+        delay = max(delay, math.ceil(breaker.retry_after()))
+
+        return min(delay, self.MAX_POLL_DELAY)
+
+    @staticmethod
+    def _completion_personal_number(response_data: Dict[str, object]) -> Optional[str]:
+        completion_data = response_data.get('completionData')
+        user = completion_data.get('user') if isinstance(completion_data, dict) else None
+        personal_number = user.get('personalNumber') if isinstance(user, dict) else None
+        return personal_number if isinstance(personal_number, str) and personal_number else None
+
+    @classmethod
+    def _personal_number(cls, response_data: Dict[str, object]) -> str:
+        personal_number = cls._completion_personal_number(response_data)
+        if personal_number is None:
+            raise ValueError(
+                'Personal number not found in completion data')
+        return personal_number
+
+    def generate_qr_code_image(self, qr_data: str, format: str = 'png') -> bytes:
+        # bankid.<qrStartToken>.<seconds since order start>.<qrAuthCode>
+        _prefix, qr_start_token, elapsed_seconds, _qr_auth_code = qr_data.split('.', 3)
+        render: Callable[['BankIDServiceBase', str], bytes] = self.QR_RENDERERS[format]
+
+        return self.QR_IMAGE_CACHE.get_or_render(
+            key=(qr_start_token, elapsed_seconds, format),
+            render=lambda: render(self, qr_data)
+        )
+
+    def _qr_code(self, qr_data: str) -> qrcode.QRCode:
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            box_size=10,
+            border=0,
+        )
+        
+        qr.add_data(qr_data)
+        qr.make(fit=True)
+        return qr
+
+    def _render_qr_code_png(self, qr_data: str) -> bytes:
+        img = self._qr_code(qr_data).make_image(fill_color="black", back_color="transparent").convert("RGBA")
+        
+        with io.BytesIO() as buffer:
+            img.save(buffer, format="PNG")
+            return buffer.getvalue()
+
+    def _render_qr_code_svg(self, qr_data: str) -> bytes:
+        """
+        Render the QR code as an SVG with one unit per module and a single path,
+        merging horizontal runs of dark modules. No Pillow involved.
+        """
+        matrix: List[List[bool]] = self._qr_code(qr_data).get_matrix()
+        size = len(matrix)
+        path: List[str] = []
+        for y, row in enumerate(matrix):
+            x = 0
+            while x < size:
+                if not row[x]:
+                    x += 1
+                    continue
+                run = 1
+                while x + run < size and row[x + run]:
+                    run += 1
+                path.append(f"M{x} {y}h{run}v1h-{run}z")
+                x += run
+
+        return (
+            f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+            f'<path fill="#000" d="{"".join(path)}"/></svg>'
+        ).encode()
+
+    def _render_qr_code_matrix(self, qr_data: str) -> bytes:
+        """
+        Render the QR code as a bit-packed module matrix for clients that draw it themselves.
+
+        The first byte is the side length n in modules, followed by the n*n modules
+        in row-major order, one bit per module (1 = dark), most significant bit first,
+        with the last byte zero-padded.
+        """
+        matrix: List[List[bool]] = self._qr_code(qr_data).get_matrix()
+        size = len(matrix)
+        packed = bytearray(1 + (size * size + 7) // 8)
+        packed[0] = size
+        index = 0
+        for row in matrix:
+            for module in row:
+                if module:
+                    packed[1 + (index >> 3)] |= 0x80 >> (index & 7)
+                index += 1
+
+        return bytes(packed)
+
+    QR_RENDERERS: Dict[str, Callable[['BankIDServiceBase', str], bytes]] = {
+        'png': _render_qr_code_png,
+        'svg': _render_qr_code_svg,
+        'matrix': _render_qr_code_matrix,
+    }
+
+
+class BankIDService(BankIDServiceBase):
+    """
+    BankID RP API client on the shared, pooled mTLS transport.
+    """
+
+    def __init__(self) -> None:
+        self.transport = BankIDTransport.get_instance()
+        self.policy = self.transport.policy
+        self.order_store = get_order_store()
+
+    def _request(self, path: str, payload: Dict[str, Union[str, bool, object]]) -> Response:
+        return self.transport.post(path=path, payload=payload)
+
+    @classmethod
+    def get_collected_status(cls, order_ref: str) -> Optional[Dict[str, object]]:
+        """
+        Return the collect response last published by the background collector.
+
+        @param order_ref: The BankID order reference.
+        @return: The collect response, or None if no collector is tracking the order.
+        """
+        return cache.get(cls.COLLECTED_STATUS_KEY.format(order_ref=order_ref))
+
+    @classmethod
+    def publish_collected_status(cls, order_ref: str, response_data: Dict[str, object], timeout: int) -> None:
+        cache.set(cls.COLLECTED_STATUS_KEY.format(order_ref=order_ref), cls.collected_status(response_data), timeout=timeout)
+
+    @classmethod
+    def clear_collected_status(cls, order_ref: str) -> None:
+        cache.delete(cls.COLLECTED_STATUS_KEY.format(order_ref=order_ref))
+
+    def _complete(self, order_ref: str, personal_number: str) -> Dict[str, str]:
+        """
+        Issue the tokens for a completed order exactly once.
+
+        Deleting the order from the store claims it, so only one poll looks up
+        the user and inserts the refresh token, in a single transaction. The
+        tokens are then kept in the store for a short while, and repeated polls
+        of the order return them instead of failing.
+
+        @param order_ref: The BankID order reference.
+        @param personal_number: The personal number BankID identified.
+        @return: A dict with access_token and refresh_token.
+        @exception: Raises ValueError if the order is unknown or no user has the personal number.
+        """
+        tokens = self.order_store.get_completion(order_ref)
+        if tokens is not None:
+            return tokens
+
+        if not self.order_store.delete(order_ref):
+            # Another poll claimed the order, wait briefly for the tokens it issues.
+            deadline = time.monotonic() + self.COMPLETION_WAIT_SECONDS
+            while time.monotonic() < deadline:
+                time.sleep(self.COMPLETION_WAIT_INTERVAL)
+                tokens = self.order_store.get_completion(order_ref)
+                if tokens is not None:
+                    return tokens
+            raise ValueError(_("Invalid order reference."))
+
+        tokens = issue_tokens(personal_number)
+        self.order_store.save_completion(order_ref, tokens)
+        record_terminal_state('complete')
+        return tokens
+
+    def _collect_result(self, order_ref: str, response_data: Dict[str, object]) -> Dict[str, Union[str, object]]:
+        status = str(response_data.get('status'))
+        hint_code = str(response_data.get('hintCode', ''))
+
+        if status != 'pending':
+            self.clear_collected_status(order_ref)
+
+        if status == 'complete':
+            return dict(self._complete(order_ref, self._personal_number(response_data)))
+        elif status == 'failed':
+            if self.order_store.delete(order_ref):
+                record_terminal_state('failed', hint_code)
+            raise ValueError(self._failed_message(hint_code))
+
+        return self._pending_result(status, hint_code)
+
     def initiate_authentication(self, end_user_ip: str) -> str:
         try:
-            response: Response = self._request(path='/rp/v6.0/auth', payload={
-                'endUserIp': end_user_ip,
-                'returnRisk': True,
-                'requirement': {
-                    'risk': 'low'
-                },
-            })
+            response: Response = self._request(path='/rp/v6.0/auth', payload=self._auth_payload(end_user_ip))
 
             response.raise_for_status()
             response_data = response.json()
 
-            auth = BankIDAuthentication.objects.create(
-                order_ref=response_data['orderRef'],
-                auto_start_token=response_data['autoStartToken'],
-                qr_start_token=response_data['qrStartToken'],
-                qr_start_secret=response_data['qrStartSecret']
-            )
+            order = self._order(response_data)
+            self.order_store.save(order)
 
-            cache.set(auth.order_ref, auth, timeout=30)
-
-            return auth.order_ref
+            return order.order_ref
         except requests.RequestException as e:
             raise
         except Exception as e:
@@ -109,92 +409,45 @@ class BankIDService():
 
     def generate_qr_code_data(self, order_ref: str) -> str:
         try:
-            auth: BankIDAuthentication = cache.get(order_ref)
+            order = self.order_store.get(order_ref)
 
-            if not auth:
-                auth = BankIDAuthentication.objects.get(order_ref=order_ref)
-                cache.set(auth.order_ref, auth, timeout=300)
+            if order is None:
+                raise ValueError(_("Invalid order reference."))
 
-            if (datetime.datetime.now(datetime.timezone.utc) - auth.created_at).total_seconds() > 30:
-                auth.delete()
+            if self._order_age(order) > self.QR_VALIDITY_SECONDS:
                 raise ValueError(
                     _("The BankID authentication session has expired."))
 
-            qr_start_token = auth.qr_start_token
-            qr_start_secret = auth.qr_start_secret
-
-            current_time = int((datetime.datetime.now(
-                datetime.timezone.utc) - auth.created_at).total_seconds())
-            qr_auth_code = hmac.new(
-                key=qr_start_secret.encode(),
-                msg=str(current_time).encode(),
-                digestmod=hashlib.sha256
-            ).hexdigest()
-
-            return f"bankid.{qr_start_token}.{current_time}.{qr_auth_code}"
-        except ObjectDoesNotExist:
-            raise ValueError(_("Invalid order reference."))
+            return self._qr_code_data(order)
         except Exception as e:
             raise
 
-    def generate_qr_code_image(self, qr_data: str) -> bytes:
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=0,
-        )
-        
-        qr.add_data(qr_data)
-        qr.make(fit=True)
+    def collect(self, order_ref: str) -> Dict[str, object]:
+        response: Response = self._request(
+            path='/rp/v6.0/collect', payload={'orderRef': order_ref})
 
-        img = qr.make_image(fill_color="black", back_color="transparent").convert("RGBA")
-        
-        with io.BytesIO() as buffer:
-            img.save(buffer, format="PNG")
-            return buffer.getvalue()
+        response.raise_for_status()
+        response_data = response.json()
+        record_collect(response_data.get('status'), response_data.get('hintCode'))
+        return response_data
 
     def poll_authentication_status(self, order_ref: str) -> Dict[str, Union[str, object]]:
         try:
-            response: Response = self._request(
-                path='/rp/v6.0/collect', payload={'orderRef': order_ref})
+            tokens = self.order_store.get_completion(order_ref)
+            if tokens is not None:
+                return dict(tokens)
 
-            response.raise_for_status()
-            response_data = response.json()
+            response_data = self.get_collected_status(order_ref)
 
-            status: str = response_data.get('status')
-            hint_code: str = response_data.get('hintCode', '')
-
-            if status == 'complete':
-                completion_data = response_data.get('completionData', {})
-                personal_number = completion_data.get(
-                    'user', {}).get('personalNumber')
-                if personal_number:
-                    try:
-                        user = User.objects.get(
-                            personal_number=personal_number)
-                        BankIDAuthentication.objects.get(
-                            order_ref=order_ref).delete()
-
-                        return {
-                            'access_token': JWTAuthentication.generate_jwt(user),
-                            'refresh_token': JWTAuthentication.generate_refresh_token(user).token
-                        }
-                    except User.DoesNotExist:
-                        raise ValueError(
-                            _('It does not seem you have an account associated with your personal number.'))
-                else:
-                    raise ValueError(
-                        'Personal number not found in completion data')
-            elif status == 'failed':
-                BankIDAuthentication.objects.get(order_ref=order_ref).delete()
-                raise ValueError(self.RFA[self.HINT_CODE_TO_RFA.get(hint_code, self.DEFAULT_HINT_CODES[status])])
+            if response_data is None:
+                response_data = self.COLLECT_COALESCER.collect(
+                    order_ref, lambda: self.collected_status(self.collect(order_ref)))
 
-            return {
-                'status': status,
-                'message': self.RFA[self.HINT_CODE_TO_RFA.get(
-                    hint_code, self.DEFAULT_HINT_CODES[status])]
-            }
+            result = self._collect_result(order_ref, response_data)
+            if result.get('status') == 'pending':
+                result['pollAfter'] = self.next_poll_delay(str(result['hintCode']), self.order_store.get(order_ref))
+
+            return result
         except requests.RequestException as e:
             raise
         except Exception as e:
@@ -202,8 +455,9 @@ class BankIDService():
 
     def cancel_authentication(self, order_ref: str) -> None:
         try:
-            auth = BankIDAuthentication.objects.get(
-                order_ref=order_ref)
+            if self.order_store.get(order_ref) is None:
+                raise ValueError(
+                    _("Invalid order reference or the authentication is not active."))
 
             response: Response = self._request(path='/rp/v6.0/cancel', payload={
                 'orderRef': order_ref
@@ -211,13 +465,12 @@ class BankIDService():
 
             response.raise_for_status()
 
-            auth.delete()
-            cache.delete(order_ref)
+            if self.order_store.delete(order_ref):
+                record_terminal_state('cancelled')
+            self.clear_collected_status(order_ref)
+            self.COLLECT_COALESCER.forget(order_ref)
 
             return None
-        except ObjectDoesNotExist:
-            raise ValueError(
-                _("Invalid order reference or the authentication is not active."))
         except requests.RequestException as e:
             raise
         except Exception as e:
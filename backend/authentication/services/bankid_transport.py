@@ -0,0 +1,137 @@
+import time
+import threading
+import requests
+from django.conf import settings
+from requests.models import Response
+from requests_pkcs12 import Pkcs12Adapter
+from authentication.services.bankid_resilience import BankIDResiliencePolicy
+from authentication.services.bankid_metrics import observe_upstream_call, operation_for, record_upstream_error
+from typing import Dict, Optional, Union
+
+
+class BankIDTransport():
+    """
+    Process-wide mTLS transport for the BankID RP API.
+
+    The PKCS#12 certificate is parsed once when the adapter is mounted and
+    connections are kept alive in a bounded urllib3 pool, shared by every
+    BankIDService instance in the process.
+    """
+    _instance: Optional['BankIDTransport'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, base_url: str, pkcs12_file: str, pkcs12_password: str, verify: Union[str, bool], pool_maxsize: int = 10, policy: Optional[BankIDResiliencePolicy] = None) -> None:
+        self.base_url = base_url
+        self.pool_maxsize = pool_maxsize
+        self.policy = policy or BankIDResiliencePolicy.get_instance()
+        self.adapter = Pkcs12Adapter(
+            pkcs12_filename=pkcs12_file,
+            pkcs12_password=pkcs12_password,
+            pool_connections=1,
+            pool_maxsize=pool_maxsize,
+            pool_block=True
+        )
+        self.session = requests.Session()
+        self.session.verify = verify
+        self.session.mount(base_url, self.adapter)
+
+    @classmethod
+    def get_instance(cls) -> 'BankIDTransport':
+        """
+        Return the shared transport, creating it from settings.BANKID on first use.
+
+        @return: The process-wide BankIDTransport.
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls(
+                        base_url=settings.BANKID['endpoint'],
+                        pkcs12_file=settings.BANKID['p12_cert_path'],
+                        pkcs12_password=settings.BANKID['p12_password'],
+                        verify=settings.BANKID['ca_cert_path'],
+                        pool_maxsize=int(settings.BANKID.get('pool_maxsize') or 10)
+                    )
+        return cls._instance
+
+    @classmethod
+    def reset_instance(cls) -> None:
+        """
+        Close and drop the shared transport, e.g. after the certificate has been rotated.
+        """
+        with cls._instance_lock:
+            if cls._instance is not None:
+                cls._instance.close()
+            cls._instance = None
+
+    def post(self, path: str, payload: Dict[str, Union[str, bool, object]]) -> Response:
+        """
+        POST to the BankID API with the operation's timeouts, retries and circuit breaker.
+
+        @param path: The BankID API path.
+        @param payload: The JSON payload.
+        @return: The final response, 4xx and exhausted 5xx responses included.
+        @exception: Raises CircuitOpenError while BankID is considered unavailable.
+        """
+        probe = self.policy.breaker.before_call()
+        self.policy.record_call()
+        operation = operation_for(path)
+        try:
+            with observe_upstream_call(operation):
+                attempt = 0
+                while True:
+                    try:
+                        response = self.session.post(f'{self.base_url}{path}', json=payload, timeout=self.policy.timeout(path))
+                    except requests.RequestException as e:
+                        record_upstream_error(operation, type(e).__name__)
+                        self.policy.breaker.record_failure(e)
+                        if not isinstance(e, (requests.ConnectionError, requests.Timeout)) or not self.policy.should_retry(path, attempt):
+                            raise
+                    else:
+                        if response.status_code >= 400:
+                            record_upstream_error(operation, response.status_code)
+                        if response.status_code < 500:
+                            self.policy.breaker.record_success()
+                            return response
+                        self.policy.breaker.record_failure(f'{response.status_code} {response.reason}')
+                        if not self.policy.should_retry(path, attempt):
+                            return response
+
+                    time.sleep(self.policy.backoff(attempt))
+                    attempt += 1
+        finally:
+            # Any exit, cancellation included, frees the half-open probe slot.
+            if probe:
+                self.policy.breaker.end_probe()
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Aggregate connection pool statistics.
+
+        A hit is a request served on an already open keep-alive connection,
+        a miss is a request that had to open (and handshake) a new one.
+
+        @return: A dict with requests, hits, misses, pools, pool_maxsize and the resilience stats.
+        """
+        requests_total = 0
+        misses = 0
+        pools = 0
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            pools += 1
+            requests_total += pool.num_requests
+            misses += pool.num_connections
+
+        return {
+            'requests': requests_total,
+            'hits': max(requests_total - misses, 0),
+            'misses': misses,
+            'pools': pools,
+            'pool_maxsize': self.pool_maxsize,
+            'resilience': self.policy.stats(),
+        }
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,90 @@
+import time
+import uuid
+import logging
+import datetime
+import threading
+from django.core.cache import cache
+from django.db import models
+from django.utils import timezone
+from authentication.models import BankIDAuthentication, RefreshToken
+from authentication.services.bankid_order_store import BankIDOrderStore
+from typing import Dict, Union
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiredAuthenticationReaper():
+    """
+    Deletes abandoned BankID orders and expired refresh tokens in bounded batches.
+
+    Each batch selects at most batch_size primary keys ordered by created_at /
+    expires_at and deletes exactly those rows, so a run never holds long locks
+    on the hot authentication tables. BankID orders only remain in the legacy
+    order table from before they moved to the BankIDOrderStore.
+    """
+    LOCK_KEY: str = 'authentication:reaper:lock'
+
+    def __init__(self, batch_size: int = 1000, max_batches: int = 100) -> None:
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+
+    def _delete_in_batches(self, queryset: models.QuerySet, order_field: str) -> int:
+        deleted = 0
+        for _batch in range(self.max_batches):
+            pks = list(queryset.order_by(order_field).values_list('pk', flat=True)[:self.batch_size])
+            if not pks:
+                break
+            count, _ = queryset.model.objects.filter(pk__in=pks).delete()
+            deleted += count
+            if len(pks) < self.batch_size:
+                break
+        return deleted
+
+    def reap(self) -> Dict[str, Union[int, float]]:
+        """
+        Run one reaping pass.
+
+        @return: Rows removed per table and the time taken in seconds.
+        """
+        started = time.monotonic()
+        now = timezone.now()
+
+        bankid_orders = self._delete_in_batches(
+            BankIDAuthentication.objects.filter(
+                created_at__lt=now - datetime.timedelta(seconds=BankIDOrderStore.ORDER_TTL_SECONDS)),
+            order_field='created_at'
+        )
+        refresh_tokens = self._delete_in_batches(
+            RefreshToken.objects.filter(expires_at__lt=now),
+            order_field='expires_at'
+        )
+
+        return {
+            'bankid_orders': bankid_orders,
+            'refresh_tokens': refresh_tokens,
+            'seconds': time.monotonic() - started,
+        }
+
+    def run_forever(self, interval: float, stop_event: threading.Event) -> None:
+        identity = uuid.uuid4().hex
+        while not stop_event.wait(interval):
+            # Only one process per deployment reaps per interval.
+            if not cache.add(self.LOCK_KEY, identity, timeout=max(int(interval) - 1, 1)):
+                continue
+            try:
+                report = self.reap()
+                logger.info(
+                    'Reaped %s BankID orders and %s refresh tokens in %.3fs',
+                    report['bankid_orders'], report['refresh_tokens'], report['seconds'])
+            except Exception as e:
+                logger.exception('Reaping expired authentication data failed: %s', e)
+
+    def start(self, interval: float) -> threading.Event:
+        stop_event = threading.Event()
+        threading.Thread(
+            target=self.run_forever,
+            args=(interval, stop_event),
+            name='authentication-reaper',
+            daemon=True
+        ).start()
+        return stop_event
@@ -0,0 +1,127 @@
+import json
+import threading
+import jwt
+from jwt.algorithms import Algorithm, OKPAlgorithm, RSAAlgorithm
+from cryptography.hazmat.primitives import serialization
+from django.conf import settings
+from authentication.services.verified_token_cache import VerifiedTokenCache
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+
+class SigningKey():
+    __slots__ = ('kid', 'algorithm', 'private_key', 'public_key')
+
+    def __init__(self, kid: str, algorithm: str, private_key: Any, public_key: Any) -> None:
+        self.kid = kid
+        self.algorithm = algorithm
+        self.private_key = private_key
+        self.public_key = public_key
+
+    def to_jwk(self) -> Dict[str, str]:
+        serializer: Type[Algorithm] = OKPAlgorithm if self.algorithm == 'EdDSA' else RSAAlgorithm
+        jwk: Dict[str, str] = json.loads(serializer.to_jwk(self.public_key))
+        jwk.update({'kid': self.kid, 'alg': self.algorithm, 'use': 'sig'})
+        return jwk
+
+
+class JWTKeyRing():
+    """
+    Asymmetric signing keys for access tokens, configured by JWT_AUTH['JWT_SIGNING_KEYS'].
+
+    Every entry is a dict with a `kid`, an `algorithm` (EdDSA or RS256) and a
+    `public_key_path`. The entry marked `signing` also needs a
+    `private_key_path` and signs new tokens; all entries verify tokens by the
+    `kid` in their header and are published in the JWKS. Rotation overlaps:
+    add the next key verify-only first so downstream caches pick it up, then
+    mark it signing, and drop the old key once its tokens have expired.
+
+    Keys are parsed once per process. Without JWT_SIGNING_KEYS tokens are
+    signed with the shared JWT_SECRET_KEY, as before.
+    """
+    ALGORITHMS: Tuple[str, ...] = ('EdDSA', 'RS256')
+
+    _instance: Optional['JWTKeyRing'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, keys: List[SigningKey], signing_kid: Optional[str]) -> None:
+        self.keys: Dict[str, SigningKey] = {key.kid: key for key in keys}
+        self.signing_key = self.keys[signing_kid] if signing_kid else None
+        self.jwks = json.dumps({'keys': [key.to_jwk() for key in keys]}).encode()
+
+    @classmethod
+    def from_settings(cls) -> 'JWTKeyRing':
+        keys: List[SigningKey] = []
+        signing_kid: Optional[str] = None
+        for entry in settings.JWT_AUTH.get('JWT_SIGNING_KEYS') or []:
+            if entry['algorithm'] not in cls.ALGORITHMS:
+                raise ValueError(f"Unsupported JWT signing algorithm: {entry['algorithm']}")
+
+            private_key = None
+            if entry.get('signing'):
+                if signing_kid is not None:
+                    raise ValueError('Only one JWT signing key can be marked signing')
+                signing_kid = entry['kid']
+                with open(entry['private_key_path'], 'rb') as f:
+                    password = entry.get('private_key_password')
+                    private_key = serialization.load_pem_private_key(f.read(), password=password.encode() if password else None)
+
+            if entry.get('public_key_path'):
+                with open(entry['public_key_path'], 'rb') as f:
+                    public_key = serialization.load_pem_public_key(f.read())
+            elif private_key is not None:
+                public_key = private_key.public_key()
+            else:
+                raise ValueError(f"JWT key {entry['kid']} needs a public_key_path unless it is the signing key")
+
+            keys.append(SigningKey(kid=entry['kid'], algorithm=entry['algorithm'], private_key=private_key, public_key=public_key))
+
+        return cls(keys=keys, signing_kid=signing_kid)
+
+    @classmethod
+    def get_instance(cls) -> 'JWTKeyRing':
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls.from_settings()
+        return cls._instance
+
+    @classmethod
+    def reset_instance(cls) -> None:
+        """
+        Drop the parsed keys, e.g. after JWT_SIGNING_KEYS changed, and forget
+        the tokens verified with them.
+        """
+        with cls._instance_lock:
+            cls._instance = None
+        VerifiedTokenCache.get_instance().clear()
+
+    def encode(self, payload: Dict[str, Any]) -> str:
+        if self.signing_key is None:
+            return jwt.encode(
+                payload=payload, key=settings.JWT_AUTH['JWT_SECRET_KEY'], algorithm=settings.JWT_AUTH['JWT_ALGORITHM']
+            )
+        return jwt.encode(
+            payload=payload,
+            key=self.signing_key.private_key,
+            algorithm=self.signing_key.algorithm,
+            headers={'kid': self.signing_key.kid}
+        )
+
+    def decode(self, token: str) -> Dict[str, Any]:
+        """
+        Verify a token with the key named by its kid, or the shared secret if it has none.
+
+        @param token: The encoded JWT.
+        @return: The verified payload.
+        @exception: Raises jwt.InvalidTokenError (or a subclass) if the token cannot be verified.
+        """
+        kid = jwt.get_unverified_header(token).get('kid')
+        if kid is None:
+            if self.signing_key is not None and not settings.JWT_AUTH.get('JWT_SECRET_KEY'):
+                raise jwt.InvalidTokenError('Token has no kid')
+            return jwt.decode(jwt=token, key=settings.JWT_AUTH['JWT_SECRET_KEY'], algorithms=[settings.JWT_AUTH['JWT_ALGORITHM']])
+
+        key = self.keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError('Unknown kid')
+        return jwt.decode(jwt=token, key=key.public_key, algorithms=[key.algorithm])
@@ -0,0 +1,85 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Tuple
+
+
+class QRImageCache():
+    """
+    Bounded, TTL-evicted in-process cache of rendered QR code frames.
+
+    Rendering is single-flight: when several requests ask for the same frame at
+    once, one of them renders it and the others wait for that result.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 2.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Hashable, Tuple[float, bytes]]' = OrderedDict()
+        self._rendering: Dict[Hashable, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_render(self, key: Hashable, render: Callable[[], bytes]) -> bytes:
+        """
+        Return the cached frame for key, rendering it at most once.
+
+        @param key: Cache key identifying the frame.
+        @param render: Callable producing the frame on a miss.
+        @return: The rendered frame.
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+
+                event = self._rendering.get(key)
+                if event is None:
+                    event = self._rendering[key] = threading.Event()
+                    self.misses += 1
+                    break
+
+            # Another thread is rendering this frame, wait for it and look again.
+            event.wait()
+
+        try:
+            value = render()
+            with self._lock:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                self._evict()
+            return value
+        finally:
+            with self._lock:
+                del self._rendering[key]
+            event.set()
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._entries and next(iter(self._entries.values()))[0] <= now:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,143 @@
+"""
+Claims for stateless access tokens (JWT_AUTH['JWT_CLAIMS_MODE']).
+
+Effective permissions travel in the `perms` claim as a bitset, base64url
+encoded without padding: bit n (least significant bit first) is set if the
+user holds the n-th permission of the PermissionIndex. The index is dense, so
+the claim grows with the number of permissions rather than with the highest
+Permission id ever allocated. The `pix` claim carries the version of the index
+the bits were encoded with, and the `pv` claim the user's permissions_version
+at issue time.
+"""
+import zlib
+import base64
+import struct
+import threading
+from django.db.models import Q
+from typing import Dict, Iterable, List, Optional, Set, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from authentication.models import User
+
+
+class PermissionIndex():
+    """
+    Bit positions of the permissions in the `perms` claim: the permissions in id order.
+
+    The version is a fingerprint of that order, so a token is only ever read
+    against the index it was encoded with.
+    """
+
+    def __init__(self, permissions: List[Tuple[int, str]]) -> None:
+        self.bits: Dict[int, int] = {permission_id: bit for bit, (permission_id, _codename) in enumerate(permissions)}
+        self.codename_bits: Dict[str, int] = {codename: bit for bit, (_permission_id, codename) in enumerate(permissions)}
+        ids = [permission_id for permission_id, _codename in permissions]
+        self.version = format(zlib.crc32(struct.pack(f'!{len(ids)}q', *ids)), '08x')
+
+    @classmethod
+    def load(cls) -> 'PermissionIndex':
+        from authentication.models import Permission
+        return cls(list(Permission.objects.order_by('id').values_list('id', 'codename')))
+
+
+_permission_index: Optional[PermissionIndex] = None
+# Versions this process has loaded past, so tokens encoded with them do not trigger another reload.
+_outdated_versions: Set[str] = set()
+_permission_index_lock = threading.Lock()
+
+
+def permission_index(version: Optional[str] = None) -> PermissionIndex:
+    """
+    Return the process's permission index, loading it on first use.
+
+    It is reloaded when a token carries a version this process has not seen
+    yet, i.e. permissions were created or deleted in another process.
+
+    @param version: The `pix` claim of the token being read, if any.
+    @return: The current PermissionIndex.
+    """
+    global _permission_index
+    index = _permission_index
+    if index is not None and (version is None or version == index.version or version in _outdated_versions):
+        return index
+    with _permission_index_lock:
+        index = _permission_index
+        if index is None or (version is not None and version != index.version and version not in _outdated_versions):
+            if index is not None:
+                _outdated_versions.add(index.version)
+            index = _permission_index = PermissionIndex.load()
+            _outdated_versions.discard(index.version)
+            if version is not None and version != index.version:
+                _outdated_versions.add(version)
+        return index
+
+
+def reload_permission_index() -> PermissionIndex:
+    """
+    Load the permission index afresh, e.g. to issue a token or after this process changed the permissions.
+
+    @return: The current PermissionIndex.
+    """
+    global _permission_index
+    index = PermissionIndex.load()
+    with _permission_index_lock:
+        if _permission_index is not None and _permission_index.version != index.version:
+            _outdated_versions.add(_permission_index.version)
+        _outdated_versions.discard(index.version)
+        _permission_index = index
+    return index
+
+
+def encode_permissions(bits: Iterable[int]) -> str:
+    value = 0
+    for bit in bits:
+        value |= 1 << bit
+    return base64.urlsafe_b64encode(value.to_bytes((value.bit_length() + 7) // 8, 'little')).rstrip(b'=').decode()
+
+
+def decode_permissions(encoded: str) -> int:
+    return int.from_bytes(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)), 'little')
+
+
+def effective_permission_ids(user_id: int) -> Set[int]:
+    """
+    @param user_id: The id of the user.
+    @return: The ids of the permissions the user holds directly or through a group, in one query.
+    """
+    from authentication.models import Permission
+    return set(
+        Permission.objects.filter(Q(users__id=user_id) | Q(groups__users__id=user_id))
+        .values_list('id', flat=True).distinct()
+    )
+
+
+def token_claims(user: 'User') -> Dict[str, object]:
+    """
+    @param user: The user the access token is issued for.
+    @return: The account, superuser, permissions, permission index version and permissions version claims.
+    """
+    index = reload_permission_index()
+    return {
+        'account_id': user.account_id,
+        'is_superuser': user.is_superuser,
+        'perms': encode_permissions(index.bits[permission_id] for permission_id in effective_permission_ids(user.id)
+                                    if permission_id in index.bits),
+        'pix': index.version,
+        'pv': user.permissions_version,
+    }
+
+
+def claims_index_current(claims: Dict[str, object]) -> bool:
+    """
+    @param claims: The token payload.
+    @return: True if the token's `perms` bits were encoded with the current permission index.
+    """
+    version = claims.get('pix')
+    return isinstance(version, str) and permission_index(version).version == version
+
+
+def has_permission(claims: Dict[str, object], codename: str) -> bool:
+    version = claims.get('pix')
+    index = permission_index(version if isinstance(version, str) else None)
+    bit = index.codename_bits.get(codename)
+    return bit is not None and index.version == version and bool(decode_permissions(str(claims.get('perms', ''))) >> bit & 1)
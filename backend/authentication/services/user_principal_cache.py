@@ -0,0 +1,178 @@
+import time
+import threading
+from collections import OrderedDict
+from django.core.cache import cache
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# id, account_id, email, is_active, is_superuser, permissions_version
+PrincipalFields = Tuple[int, int, str, bool, bool, int]
+
+
+class UserPrincipal():
+    """
+    Lightweight stand-in for the authenticated User.
+
+    Holds the fields authentication and the account/superuser checks need.
+    Anything else (permissions, groups, the account object, ...) is read from
+    the full User, which is loaded on first access only. `claims` holds the
+    verified claims of a stateless access token, if the request carried one.
+    """
+    __slots__ = ('id', 'account_id', 'email', 'is_active', 'is_superuser', 'permissions_version', 'claims', '_user')
+    is_authenticated: bool = True
+
+    def __init__(self, id: int, account_id: int, email: str, is_active: bool, is_superuser: bool, permissions_version: int = 0) -> None:
+        self.id = id
+        self.account_id = account_id
+        self.email = email
+        self.is_active = is_active
+        self.is_superuser = is_superuser
+        self.permissions_version = permissions_version
+        self.claims: Optional[Dict[str, Any]] = None
+        self._user = None
+
+    @property
+    def pk(self) -> int:
+        return self.id
+
+    @property
+    def user(self) -> Any:
+        """
+        @return: The full User, loaded on first access.
+        """
+        if self._user is None:
+            from authentication.models import User
+            self._user = User.objects.get(pk=self.id)
+        return self._user
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for attributes the principal does not have itself.
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __eq__(self, other: object) -> bool:
+        from authentication.models import User
+        if isinstance(other, UserPrincipal):
+            return self.id == other.id
+        return isinstance(other, User) and other.pk == self.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    def __str__(self) -> str:
+        return str({"content_type": "user", "id": self.id, "email": self.email})
+
+    def as_tuple(self) -> 'PrincipalFields':
+        return (self.id, self.account_id, self.email, self.is_active, self.is_superuser, self.permissions_version)
+
+
+class UserPrincipalCache():
+    """
+    Two-level cache of user principals by user id.
+
+    A bounded, TTL-evicted LRU in every process sits in front of an entry in the
+    shared cache, so a user already seen by any worker authenticates without a
+    database query. Saving or deleting a User drops both (see authentication.signals);
+    other processes pick the change up once their local entry expires, after at
+    most local_ttl seconds, or right away for a token that already carries it
+    (see reload()).
+    """
+    KEY: str = 'auth:principal:v2:{user_id}'
+
+    _instance: Optional['UserPrincipalCache'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, maxsize: int = 10000, local_ttl: float = 30.0, shared_ttl: int = 300) -> None:
+        self.maxsize = maxsize
+        self.local_ttl = local_ttl
+        self.shared_ttl = shared_ttl
+        self._entries: 'OrderedDict[int, Tuple[float, PrincipalFields]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def get_instance(cls) -> 'UserPrincipalCache':
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def get(self, user_id: int) -> Optional[UserPrincipal]:
+        """
+        Return the principal of a user, loading it on a miss.
+
+        Every call returns a new principal, so the full User one request loads
+        through it is never shared with another request.
+
+        @param user_id: The id of the user.
+        @return: The UserPrincipal, or None if there is no such user.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return UserPrincipal(*entry[1])
+
+        fields: Optional[PrincipalFields] = cache.get(self.KEY.format(user_id=user_id))
+        if fields is not None:
+            with self._lock:
+                self.shared_hits += 1
+        else:
+            from authentication.models import User
+            try:
+                fields = User.objects.values_list(
+                    'id', 'account_id', 'email', 'is_active', 'is_superuser', 'permissions_version').get(id=user_id)
+            except User.DoesNotExist:
+                return None
+            cache.set(self.KEY.format(user_id=user_id), fields, timeout=self.shared_ttl)
+            with self._lock:
+                self.misses += 1
+
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.local_ttl, fields)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return UserPrincipal(*fields)
+
+    def reload(self, user_id: int) -> Optional[UserPrincipal]:
+        """
+        Drop this process's entry and load the principal again from the shared cache or the database.
+
+        For requests carrying a change another process has already seen, e.g. a
+        token issued after a permissions version bump.
+
+        @param user_id: The id of the user.
+        @return: The UserPrincipal, or None if there is no such user.
+        """
+        with self._lock:
+            self._entries.pop(user_id, None)
+        return self.get(user_id)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+        cache.delete(self.KEY.format(user_id=user_id))
+
+    def invalidate_many(self, user_ids: Iterable[int]) -> None:
+        user_ids = list(user_ids)
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+        cache.delete_many([self.KEY.format(user_id=user_id) for user_id in user_ids])
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
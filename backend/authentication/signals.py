@@ -0,0 +1,98 @@
+from typing import Any, Iterable, Optional, Set
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from authentication.models import Group, Permission, User
+from authentication.services.user_principal_cache import UserPrincipalCache
+from authentication.services.token_claims import reload_permission_index
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_principal(sender: type, instance: User, **kwargs: Any) -> None:
+    # Covers is_active, is_superuser, email and account changes made through the model.
+    UserPrincipalCache.get_instance().invalidate(instance.id)
+
+
+def bump_permissions_version(user_ids: Iterable[int]) -> None:
+    """
+    Invalidate the stateless access tokens of users whose effective permissions changed.
+
+    @param user_ids: The ids of the affected users.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    User.objects.filter(id__in=user_ids).update(permissions_version=F('permissions_version') + 1)
+    UserPrincipalCache.get_instance().invalidate_many(user_ids)
+
+
+def _group_member_ids(group_ids: Iterable[int]) -> Set[int]:
+    return set(User.objects.filter(groups__id__in=list(group_ids)).values_list('id', flat=True))
+
+
+def _permission_holder_ids(permission_ids: Iterable[int]) -> Set[int]:
+    permission_ids = list(permission_ids)
+    return (
+        set(User.objects.filter(user_permissions__id__in=permission_ids).values_list('id', flat=True))
+        | set(User.objects.filter(groups__permissions__id__in=permission_ids).values_list('id', flat=True))
+    )
+
+
+def _changed(action: str) -> bool:
+    # Clears are handled before the rows are gone, while the affected users can still be found.
+    return action in ('post_add', 'post_remove', 'pre_clear')
+
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def user_permissions_changed(sender: type, instance: Any, action: str, reverse: bool, pk_set: Optional[Set[int]], **kwargs: Any) -> None:
+    if not _changed(action):
+        return
+    if not reverse:
+        bump_permissions_version([instance.id])
+    elif pk_set is not None:
+        bump_permissions_version(pk_set)
+    else:
+        bump_permissions_version(_permission_holder_ids([instance.id]))
+
+
+@receiver(m2m_changed, sender=Group.users.through)
+def group_users_changed(sender: type, instance: Any, action: str, reverse: bool, pk_set: Optional[Set[int]], **kwargs: Any) -> None:
+    if not _changed(action):
+        return
+    if reverse:
+        bump_permissions_version([instance.id])
+    elif pk_set is not None:
+        bump_permissions_version(pk_set)
+    else:
+        bump_permissions_version(_group_member_ids([instance.id]))
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender: type, instance: Any, action: str, reverse: bool, pk_set: Optional[Set[int]], **kwargs: Any) -> None:
+    if not _changed(action):
+        return
+    if not reverse:
+        bump_permissions_version(_group_member_ids([instance.id]))
+    elif pk_set is not None:
+        bump_permissions_version(_group_member_ids(pk_set))
+    else:
+        bump_permissions_version(_permission_holder_ids([instance.id]))
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleted(sender: type, instance: Group, **kwargs: Any) -> None:
+    bump_permissions_version(_group_member_ids([instance.id]))
+
+
+@receiver(pre_delete, sender=Permission)
+def permission_deleted(sender: type, instance: Permission, **kwargs: Any) -> None:
+    bump_permissions_version(_permission_holder_ids([instance.id]))
+
+
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def permissions_changed(sender: type, instance: Permission, created: bool = True, **kwargs: Any) -> None:
+    # Renames keep the bit positions, creating or deleting a permission moves to a new index version.
+    if created:
+        reload_permission_index()
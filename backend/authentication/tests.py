@@ -1 +1,477 @@
-from django.test import TestCase
+import time
+import asyncio
+import datetime
+import threading
+import json
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.contrib.contenttypes.models import ContentType
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import exceptions
+from authentication.jwt_authentication import JWTAuthentication
+from authentication.models import Account, Permission, RefreshToken, User
+from authentication.services.bankid_admission import AdmissionDenied, BankIDAdmissionController, CacheRateLimit
+from authentication.services.async_bankid_service import AsyncBankIDService
+from authentication.services.async_bankid_transport import AsyncBankIDTransport
+from authentication.services.bankid_collect_coalescer import BankIDCollectCoalescer, CollectResult
+from authentication.services.bankid_order_store import BankIDOrder, CacheBankIDOrderStore, InMemoryBankIDOrderStore
+from authentication.services.bankid_resilience import BankIDResiliencePolicy, CircuitBreaker, CircuitOpenError
+from authentication.services.token_claims import decode_permissions, has_permission
+from authentication.services.user_principal_cache import UserPrincipalCache
+from typing import Any
+
+
+class RefreshTokenRotationTests(TestCase):
+    def setUp(self) -> None:
+        account = Account.objects.create(name='Rotation')
+        self.user = User.objects.create(
+            email='rotation@example.com',
+            account=account,
+            personal_number='199001012385',
+            first_name='Rotation',
+            last_name='Test'
+        )
+        self.refresh_token = JWTAuthentication.generate_refresh_token(self.user)
+        self.family = RefreshToken.objects.get(token_hash=RefreshToken.hash_token(self.refresh_token)).family
+
+    def rotated_long_ago(self) -> None:
+        RefreshToken.objects.filter(token_hash=RefreshToken.hash_token(self.refresh_token)).update(
+            rotated_at=timezone.now() - settings.JWT_AUTH['JWT_REFRESH_REUSE_GRACE'] - datetime.timedelta(seconds=1))
+
+    def test_rotation_keeps_family(self) -> None:
+        _access_token, new_refresh_token = JWTAuthentication.refresh_access_token(self.refresh_token)
+
+        new_token = RefreshToken.objects.get(token_hash=RefreshToken.hash_token(new_refresh_token))
+        self.assertEqual(new_token.family, self.family)
+        self.assertIsNone(new_token.rotated_at)
+        self.assertIsNotNone(RefreshToken.objects.get(token_hash=RefreshToken.hash_token(self.refresh_token)).rotated_at)
+
+    def test_reuse_within_grace_is_allowed(self) -> None:
+        JWTAuthentication.refresh_access_token(self.refresh_token)
+        JWTAuthentication.refresh_access_token(self.refresh_token)
+
+        self.assertEqual(RefreshToken.objects.filter(family=self.family).count(), 3)
+
+    def test_reuse_revokes_family(self) -> None:
+        _access_token, new_refresh_token = JWTAuthentication.refresh_access_token(self.refresh_token)
+        self.rotated_long_ago()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            JWTAuthentication.refresh_access_token(self.refresh_token)
+
+        self.assertFalse(RefreshToken.objects.filter(family=self.family).exists())
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            JWTAuthentication.refresh_access_token(new_refresh_token)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def open_breaker(self, open_seconds: float = 60.0) -> CircuitBreaker:
+        breaker = CircuitBreaker(error_threshold=0.5, min_calls=4, open_seconds=open_seconds)
+        for _ in range(2):
+            breaker.record_success()
+        for _ in range(2):
+            breaker.record_failure('503 Service Unavailable')
+        return breaker
+
+    def test_opens_at_error_threshold(self) -> None:
+        breaker = self.open_breaker()
+
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        self.assertEqual(breaker.stats()['rejected_calls'], 1)
+
+    def test_stays_closed_below_min_calls(self) -> None:
+        breaker = CircuitBreaker(min_calls=4)
+        for _ in range(3):
+            breaker.record_failure('timeout')
+
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertFalse(breaker.before_call())
+
+    def test_half_open_lets_one_probe_through(self) -> None:
+        breaker = self.open_breaker(open_seconds=0)
+
+        self.assertTrue(breaker.before_call())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_successful_probe_closes(self) -> None:
+        breaker = self.open_breaker(open_seconds=0)
+        breaker.before_call()
+        breaker.record_success()
+
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertFalse(breaker.before_call())
+
+    def test_failed_probe_reopens(self) -> None:
+        breaker = self.open_breaker(open_seconds=60)
+        breaker.opened_at -= 60
+        breaker.before_call()
+        breaker.record_failure('timeout')
+
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_probe_without_outcome_is_released(self) -> None:
+        breaker = self.open_breaker(open_seconds=0)
+        breaker.before_call()
+        breaker.end_probe()
+
+        self.assertTrue(breaker.before_call())
+
+
+class RetryBudgetTests(SimpleTestCase):
+    def test_only_idempotent_calls_are_retried(self) -> None:
+        policy = BankIDResiliencePolicy(max_retries=2, breaker=CircuitBreaker())
+        policy.record_call()
+
+        self.assertFalse(policy.should_retry('/rp/v6.0/auth', 0))
+        self.assertTrue(policy.should_retry('/rp/v6.0/collect', 0))
+        self.assertFalse(policy.should_retry('/rp/v6.0/collect', 2))
+
+    def test_budget_limits_retries(self) -> None:
+        policy = BankIDResiliencePolicy(max_retries=5, retry_budget_ratio=0.1, retry_budget_min=3, breaker=CircuitBreaker())
+        for _ in range(10):
+            policy.record_call()
+
+        retried = sum(policy.should_retry('/rp/v6.0/collect', 0) for _ in range(10))
+
+        self.assertEqual(retried, 3)
+        self.assertEqual(policy.stats()['retries_denied'], 7)
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'authentication-tests'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CollectCoalescerTests(SimpleTestCase):
+    CALLERS = 5
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.coalescer = BankIDCollectCoalescer()
+        self.upstream_calls = 0
+
+    def wait_for_waiters(self) -> None:
+        deadline = time.monotonic() + 5
+        while self.coalescer.coalesced < self.CALLERS - 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_concurrent_callers_share_one_upstream_call(self) -> None:
+        def collect() -> CollectResult:
+            self.upstream_calls += 1
+            self.wait_for_waiters()
+            return {'status': 'pending', 'hintCode': 'outstandingTransaction'}
+
+        results: list = []
+        threads = [threading.Thread(target=lambda: results.append(self.coalescer.collect('order', collect)))
+                   for _ in range(self.CALLERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.upstream_calls, 1)
+        self.assertEqual(len(results), self.CALLERS)
+        self.assertTrue(all(result == results[0] for result in results))
+
+    def test_concurrent_tasks_share_one_upstream_call(self) -> None:
+        async def collect() -> CollectResult:
+            self.upstream_calls += 1
+            await asyncio.sleep(0.05)
+            return {'status': 'pending', 'hintCode': 'userSign'}
+
+        async def poll() -> list:
+            return await asyncio.gather(*(self.coalescer.acollect('order', collect) for _ in range(self.CALLERS)))
+
+        results = asyncio.run(poll())
+
+        self.assertEqual(self.upstream_calls, 1)
+        self.assertEqual(results, [{'status': 'pending', 'hintCode': 'userSign'}] * self.CALLERS)
+
+    def test_cancelled_leader_does_not_fail_waiters(self) -> None:
+        async def collect() -> CollectResult:
+            self.upstream_calls += 1
+            await asyncio.sleep(0.1)
+            return {'status': 'complete', 'hintCode': ''}
+
+        async def poll() -> list:
+            leader = asyncio.create_task(self.coalescer.acollect('order', collect))
+            await asyncio.sleep(0.01)
+            waiters = [asyncio.create_task(self.coalescer.acollect('order', collect)) for _ in range(self.CALLERS - 1)]
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await asyncio.gather(*waiters)
+
+        results = asyncio.run(poll())
+
+        self.assertEqual(results, [{'status': 'complete', 'hintCode': ''}] * (self.CALLERS - 1))
+        self.assertEqual(self.upstream_calls, 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BankIDOrderLayoutTests(SimpleTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.order = BankIDOrder(
+            order_ref='131daac9-16c6-4618-beb0-365768f37288',
+            auto_start_token='7c40b5c9-fa74-49cf-b98c-bfe651f9a7c6',
+            qr_start_token='67df3917-fa0d-44e5-b327-edcc928297f8',
+            qr_auth_codes=bytes(range(32)) * 3,
+            created_at=datetime.datetime(2026, 10, 18, 12, 30, 1, 123456, tzinfo=datetime.timezone.utc)
+        )
+
+    def test_round_trip(self) -> None:
+        data = self.order.to_bytes()
+
+        self.assertEqual(data[0], BankIDOrder.SCHEMA_VERSION)
+        self.assertEqual(BankIDOrder.from_bytes(data), self.order)
+
+    def test_round_trip_without_qr_auth_codes(self) -> None:
+        self.order.qr_auth_codes = b''
+
+        self.assertEqual(BankIDOrder.from_bytes(self.order.to_bytes()), self.order)
+
+    def test_rejects_other_schema_version(self) -> None:
+        data = bytes([BankIDOrder.SCHEMA_VERSION + 1]) + self.order.to_bytes()[1:]
+
+        with self.assertRaises(ValueError):
+            BankIDOrder.from_bytes(data)
+
+    def test_rejects_truncated_header(self) -> None:
+        with self.assertRaises(ValueError):
+            BankIDOrder.from_bytes(self.order.to_bytes()[:BankIDOrder.HEADER.size - 1])
+
+    def test_cache_store_round_trip(self) -> None:
+        store = CacheBankIDOrderStore()
+        store.save(self.order)
+
+        self.assertEqual(store.get(self.order.order_ref), self.order)
+        self.assertEqual(store.active_order_refs(), [self.order.order_ref])
+        self.assertEqual(store.active_order_count(), 1)
+
+        self.assertTrue(store.delete(self.order.order_ref))
+        self.assertIsNone(store.get(self.order.order_ref))
+        self.assertEqual(store.active_order_refs(), [])
+        self.assertEqual(store.active_order_count(), 0)
+
+    def test_cache_store_ignores_unreadable_entries(self) -> None:
+        store = CacheBankIDOrderStore()
+        cache.set(CacheBankIDOrderStore.ORDER_KEY.format(order_ref=self.order.order_ref), b'\x00')
+
+        self.assertIsNone(store.get(self.order.order_ref))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AdmissionControlTests(SimpleTestCase):
+    ATTEMPTS = 40
+
+    def setUp(self) -> None:
+        cache.clear()
+        patcher = mock.patch('authentication.services.bankid_admission.get_order_store', return_value=InMemoryBankIDOrderStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def controller(self, ip_burst: int, global_burst: int) -> BankIDAdmissionController:
+        return BankIDAdmissionController(
+            ip_limit=CacheRateLimit('ip', rate=0.01, burst=ip_burst),
+            global_limit=CacheRateLimit('global', rate=0.01, burst=global_burst),
+            max_open_orders=1000
+        )
+
+    def admit_concurrently(self, controller: BankIDAdmissionController, client_ips: list) -> list:
+        barrier = threading.Barrier(len(client_ips))
+        get = LocMemCache.get
+
+        def slow_get(cache: LocMemCache, *args: Any, **kwargs: Any) -> Any:
+            # Widen the gap between reading and counting, as a networked cache would.
+            time.sleep(0.01)
+            return get(cache, *args, **kwargs)
+
+        patcher = mock.patch.object(LocMemCache, 'get', slow_get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        def admit(client_ip: str) -> str:
+            barrier.wait()
+            try:
+                controller.admit(client_ip)
+                return 'admitted'
+            except AdmissionDenied as e:
+                return e.reason
+
+        with ThreadPoolExecutor(max_workers=len(client_ips)) as executor:
+            return list(executor.map(admit, client_ips))
+
+    def test_concurrent_burst_from_one_ip_is_capped(self) -> None:
+        controller = self.controller(ip_burst=5, global_burst=1000)
+
+        results = self.admit_concurrently(controller, ['192.0.2.1'] * self.ATTEMPTS)
+
+        self.assertEqual(results.count('admitted'), 5)
+        self.assertEqual(results.count('client_rate'), self.ATTEMPTS - 5)
+        self.assertEqual(controller.stats()['admitted'], 5)
+
+    def test_concurrent_burst_is_capped_globally(self) -> None:
+        controller = self.controller(ip_burst=5, global_burst=10)
+
+        results = self.admit_concurrently(controller, [f'192.0.2.{i}' for i in range(self.ATTEMPTS)])
+
+        self.assertEqual(results.count('admitted'), 10)
+        self.assertEqual(results.count('global_rate'), self.ATTEMPTS - 10)
+
+    def test_rejected_requests_give_tokens_back(self) -> None:
+        controller = self.controller(ip_burst=2, global_burst=1000)
+        for _ in range(5):
+            try:
+                controller.admit('192.0.2.1')
+            except AdmissionDenied:
+                pass
+
+        _previous_key, current_key, _progress = controller.ip_limit._keys('192.0.2.1', time.time())
+        self.assertEqual(cache.get(current_key), 2)
+
+    def test_rejects_when_too_many_orders_are_open(self) -> None:
+        controller = self.controller(ip_burst=5, global_burst=1000)
+        controller.max_open_orders = 0
+
+        with self.assertRaises(AdmissionDenied) as denied:
+            controller.admit('192.0.2.1')
+        self.assertEqual(denied.exception.reason, 'open_orders')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BatchPollTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.order_store = InMemoryBankIDOrderStore()
+        self.order = BankIDOrder(
+            order_ref='131daac9-16c6-4618-beb0-365768f37288',
+            auto_start_token='7c40b5c9-fa74-49cf-b98c-bfe651f9a7c6',
+            qr_start_token='67df3917-fa0d-44e5-b327-edcc928297f8',
+            qr_auth_codes=b'',
+            created_at=timezone.now()
+        )
+        self.order_store.save(self.order)
+        self.collect = mock.AsyncMock(return_value={'status': 'pending', 'hintCode': 'outstandingTransaction'})
+        for patcher in (
+            mock.patch('authentication.services.async_bankid_service.get_order_store', return_value=self.order_store),
+            mock.patch.object(AsyncBankIDTransport, 'get_instance', return_value=mock.Mock(policy=BankIDResiliencePolicy())),
+            mock.patch.object(AsyncBankIDService, 'collect', self.collect),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_unknown_orders_are_dropped_without_calling_bankid(self) -> None:
+        results = asyncio.run(AsyncBankIDService().poll_many([self.order.order_ref, 'unknown', 'unknown']))
+
+        self.assertEqual(list(results), [self.order.order_ref])
+        self.assertEqual(results[self.order.order_ref]['status'], 'pending')
+        self.collect.assert_awaited_once_with(self.order.order_ref)
+
+    def test_requires_authentication(self) -> None:
+        response = self.client.post(reverse('bankid_poll_batch'), data=json.dumps({'orderRefs': ['unknown']}),
+                                    content_type='application/json')
+
+        self.assertEqual(response.status_code, 401)
+        self.collect.assert_not_awaited()
+
+    def test_authenticated_poll(self) -> None:
+        account = Account.objects.create(name='Kiosk')
+        user = User.objects.create(email='kiosk@example.com', account=account, personal_number='199001012385',
+                                   first_name='Kiosk', last_name='Test')
+
+        response = self.client.post(reverse('bankid_poll_batch'), data=json.dumps({'orderRefs': [self.order.order_ref, 'unknown']}),
+                                    content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {JWTAuthentication.generate_jwt(user)}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()['results']), [self.order.order_ref])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, JWT_AUTH={**settings.JWT_AUTH, 'JWT_CLAIMS_MODE': True})
+class TokenClaimsTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        patcher = mock.patch.object(UserPrincipalCache, '_instance', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        account = Account.objects.create(name='Claims')
+        self.user = User.objects.create(email='claims@example.com', account=account, personal_number='199001012385',
+                                        first_name='Claims', last_name='Test')
+        self.permission = Permission.objects.create(name='Can view reports', codename='view_reports',
+                                                    content_type=ContentType.objects.get_for_model(User))
+
+    def authenticate(self, token: str) -> Any:
+        return JWTAuthentication.authenticate(RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}'))
+
+    def test_permission_change_invalidates_claims(self) -> None:
+        token = JWTAuthentication.generate_jwt(self.user)
+        principal, _token = self.authenticate(token)
+        self.assertFalse(has_permission(principal.claims, 'view_reports'))
+
+        self.user.user_permissions.add(self.permission)
+
+        with self.assertRaisesMessage(exceptions.AuthenticationFailed, 'Token is outdated'):
+            self.authenticate(token)
+        self.user.refresh_from_db()
+        principal, _token = self.authenticate(JWTAuthentication.generate_jwt(self.user))
+        self.assertEqual(principal.claims['pv'], 1)
+        self.assertTrue(has_permission(principal.claims, 'view_reports'))
+
+    def test_deactivated_user_is_rejected(self) -> None:
+        token = JWTAuthentication.generate_jwt(self.user)
+        self.authenticate(token)
+
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaisesMessage(exceptions.AuthenticationFailed, 'User is inactive'):
+            self.authenticate(token)
+
+    def test_newer_token_is_accepted_by_a_stale_process(self) -> None:
+        self.authenticate(JWTAuthentication.generate_jwt(self.user))
+        # Another process handled the change: the database and the shared cache moved on, this process's entry did not.
+        User.objects.filter(id=self.user.id).update(permissions_version=1, is_superuser=True)
+        cache.delete(UserPrincipalCache.KEY.format(user_id=self.user.id))
+        self.user.refresh_from_db()
+
+        principal, _token = self.authenticate(JWTAuthentication.generate_jwt(self.user))
+
+        self.assertEqual(principal.permissions_version, 1)
+        self.assertTrue(principal.is_superuser)
+
+    def test_permission_bits_are_dense(self) -> None:
+        permission = Permission.objects.create(id=100000, name='Can export reports', codename='export_reports',
+                                               content_type=ContentType.objects.get_for_model(User))
+        self.user.user_permissions.add(permission)
+        self.user.refresh_from_db()
+
+        principal, _token = self.authenticate(JWTAuthentication.generate_jwt(self.user))
+
+        self.assertEqual(decode_permissions(principal.claims['perms']), 0b10)
+        self.assertTrue(has_permission(principal.claims, 'export_reports'))
+        self.assertFalse(has_permission(principal.claims, 'view_reports'))
+        with self.assertNumQueries(0):
+            self.assertFalse(has_permission(principal.claims, 'missing'))
+
+    def test_new_permission_index_outdates_tokens(self) -> None:
+        old_token = JWTAuthentication.generate_jwt(self.user)
+        # Created by another process: no signal reaches this one.
+        Permission.objects.bulk_create([Permission(name='Can audit', codename='audit',
+                                                   content_type=ContentType.objects.get_for_model(User))])
+        self.authenticate(old_token)
+
+        new_token = JWTAuthentication.generate_jwt(self.user)
+
+        with self.assertRaisesMessage(exceptions.AuthenticationFailed, 'Token is outdated'):
+            self.authenticate(old_token)
+        principal, _token = self.authenticate(new_token)
+        self.assertFalse(has_permission(principal.claims, 'audit'))
@@ -11,7 +11,14 @@ from .authentication_views import (
     generate_qr_code,
     poll_authentication_status,
     cancel_authentication,
+    async_bankid_initiate_authentication,
+    async_poll_authentication_status,
+    async_cancel_authentication,
+    batch_poll_authentication_status,
+    bankid_status_stream,
+    bankid_metrics,
     set_language, 
+    jwks,
     logout
 )
 from .views import (
@@ -35,12 +42,25 @@ urlpatterns = [
     # Logout
     path('authentication/logout/', logout, name='logout'),
     
+    # Public keys for verifying access tokens
+    path('.well-known/jwks.json', jwks, name='jwks'),
+    
     # BankID authentication
     path('authentication/bankid/initiate/', bankid_initiate_authentication, name='bankid_initiate'),
     path('authentication/bankid/qr/<str:order_ref>/', generate_qr_code, name='bankid_qr_code'),
     path('authentication/bankid/poll/<str:order_ref>/', poll_authentication_status, name='bankid_poll'),
     path('authentication/bankid/cancel/<str:order_ref>/', cancel_authentication, name='bankid_cancel'),
     
+    # BankID authentication (asyncio, served through project.asgi)
+    path('authentication/bankid/async/initiate/', async_bankid_initiate_authentication, name='bankid_initiate_async'),
+    path('authentication/bankid/async/poll/<str:order_ref>/', async_poll_authentication_status, name='bankid_poll_async'),
+    path('authentication/bankid/async/cancel/<str:order_ref>/', async_cancel_authentication, name='bankid_cancel_async'),
+    path('authentication/bankid/async/poll/', batch_poll_authentication_status, name='bankid_poll_batch'),
+    path('authentication/bankid/stream/<str:order_ref>/', bankid_status_stream, name='bankid_stream'),
+    
+    # BankID metrics in Prometheus text format
+    path('authentication/bankid/metrics/', bankid_metrics, name='bankid_metrics'),
+    
     # Change language
     path('set_language/', set_language, name='set_language'),
     
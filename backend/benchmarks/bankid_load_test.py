@@ -0,0 +1,241 @@
+"""
+End-to-end load test of the BankID login flow: initiate -> QR -> poll -> tokens.
+
+Simulated users run the flow concurrently against the Django app in-process
+(through the Django test client, so every DB query can be attributed to the
+endpoint that issued it) while BANKID_ENDPOINT points at a local stand-in,
+normally benchmarks.bankid_simulator. Run it with e.g.
+
+    python -m benchmarks.bankid_load_test --users 200 --duration 60 --output results.json
+
+Throughput, p50/p95/p99 latency, error and DB query counts per endpoint and the
+upstream call counts reported by the stand-in's /stats are written as JSON, so
+runs can be compared between releases.
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import datetime
+import ipaddress
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+
+class EndpointStats():
+    def __init__(self) -> None:
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.db_queries = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool, db_queries: int) -> None:
+        with self.lock:
+            self.latencies.append(seconds)
+            self.db_queries += db_queries
+            if not ok:
+                self.errors += 1
+
+    def summary(self, duration: float) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            # Nearest-rank percentile, in milliseconds.
+            return latencies[min(count - 1, max(0, math.ceil(p / 100 * count) - 1))] * 1000
+
+        return {
+            'requests': count,
+            'errors': self.errors,
+            'throughput_rps': count / duration if duration else 0.0,
+            'latency_ms': {
+                'mean': sum(latencies) / count * 1000 if count else None,
+                'p50': percentile(50),
+                'p95': percentile(95),
+                'p99': percentile(99),
+                'max': latencies[-1] * 1000 if latencies else None,
+            },
+            'db_queries': self.db_queries,
+            'db_queries_per_request': self.db_queries / count if count else None,
+        }
+
+
+class LoadTest():
+    ENDPOINTS = ('bankid_initiate', 'bankid_qr_code', 'bankid_poll')
+
+    def __init__(self, users: int, duration: float, poll_interval: float, qr_interval: float, login_timeout: float) -> None:
+        self.users = users
+        self.duration = duration
+        self.poll_interval = poll_interval
+        self.qr_interval = qr_interval
+        self.login_timeout = login_timeout
+        self.stats: Dict[str, EndpointStats] = {endpoint: EndpointStats() for endpoint in self.ENDPOINTS}
+        self.logins_completed = 0
+        self.logins_failed = 0
+        self.lock = threading.Lock()
+
+    def timed(self, endpoint: str, call: Callable[[], Any]) -> Any:
+        from django.db import connection
+
+        queries = [0]
+
+        def count_queries(execute: Callable, sql: str, params: Any, many: bool, context: Dict[str, Any]) -> Any:
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_queries):
+            response = call()
+        self.stats[endpoint].record(time.perf_counter() - started, response.status_code < 400, queries[0])
+        return response
+
+    def login(self, client: Any) -> bool:
+        from django.urls import reverse
+
+        response = self.timed('bankid_initiate', lambda: client.post(reverse('bankid_initiate')))
+        if response.status_code != 200:
+            return False
+        order_ref = response.json()['orderRef']
+
+        started = time.monotonic()
+        next_qr = next_poll = started
+        while time.monotonic() - started < self.login_timeout:
+            now = time.monotonic()
+            if now >= next_qr:
+                next_qr = now + self.qr_interval
+                self.timed('bankid_qr_code', lambda: client.get(reverse('bankid_qr_code', args=[order_ref])))
+            if now >= next_poll:
+                response = self.timed('bankid_poll', lambda: client.get(reverse('bankid_poll', args=[order_ref])))
+                if response.status_code != 200:
+                    return False
+                data = response.json()
+                if 'access_token' in data:
+                    return True
+                # Honour the server's poll cadence like the frontend does, falling back to the fixed interval.
+                next_poll = time.monotonic() + float(data.get('pollAfter', self.poll_interval))
+            time.sleep(max(0.0, min(next_qr, next_poll) - time.monotonic()))
+        return False
+
+    def user(self, index: int, deadline: float) -> None:
+        from django.db import connection
+        from django.test import Client
+
+        # A distinct client address per simulated user, as real users have, so the
+        # per-IP admission bucket limits each user instead of the whole run.
+        client_ip = str(ipaddress.ip_address('10.0.0.1') + index)
+        client = Client(HTTP_HOST='localhost', REMOTE_ADDR=client_ip)
+        try:
+            while time.monotonic() < deadline:
+                completed = self.login(client)
+                with self.lock:
+                    if completed:
+                        self.logins_completed += 1
+                    else:
+                        self.logins_failed += 1
+        finally:
+            connection.close()
+
+    def run(self) -> Dict[str, Any]:
+        started = time.monotonic()
+        deadline = started + self.duration
+        with ThreadPoolExecutor(max_workers=self.users) as executor:
+            for future in [executor.submit(self.user, index, deadline) for index in range(self.users)]:
+                future.result()
+        elapsed = time.monotonic() - started
+
+        return {
+            'duration_s': elapsed,
+            'logins_completed': self.logins_completed,
+            'logins_failed': self.logins_failed,
+            'logins_per_s': self.logins_completed / elapsed if elapsed else 0.0,
+            'endpoints': {endpoint: stats.summary(elapsed) for endpoint, stats in self.stats.items()},
+        }
+
+
+def upstream_stats() -> Optional[Dict[str, Any]]:
+    from authentication.services.bankid_transport import BankIDTransport
+
+    transport = BankIDTransport.get_instance()
+    try:
+        response = transport.session.get(f'{transport.base_url}/stats', timeout=5)
+        response.raise_for_status()
+        return response.json()
+    except Exception:
+        return None
+
+
+def upstream_calls(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+    if before is None or after is None:
+        return None
+    return {operation: after['calls'][operation] - before['calls'].get(operation, 0) for operation in after['calls']}
+
+
+def ensure_user(personal_number: str) -> None:
+    from authentication.models import Account, User
+
+    if User.objects.filter(personal_number=personal_number).exists():
+        return
+    account, _ = Account.objects.get_or_create(name='Load test')
+    # UserManager.create_user relies on normalize_email, which a plain models.Manager lacks.
+    User.objects.create(
+        email=f'loadtest+{personal_number}@example.com',
+        account=account,
+        personal_number=personal_number,
+        first_name='Load',
+        last_name='Test'
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='End-to-end BankID login load test')
+    parser.add_argument('--users', type=int, default=50, help='Concurrent simulated users')
+    parser.add_argument('--duration', type=float, default=60.0, help='Seconds to run')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds between polls per user when the server suggests none')
+    parser.add_argument('--qr-interval', type=float, default=1.0, help='Seconds between QR fetches per user')
+    parser.add_argument('--login-timeout', type=float, default=60.0, help='Give up on a login after this many seconds')
+    parser.add_argument('--personal-number', default='199001012385',
+                        help='Personal number the stand-in completes with; a user is created for it if missing')
+    parser.add_argument('--output', default='bankid_load_test.json', help='Where to write the JSON results')
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+    import django
+    django.setup()
+
+    ensure_user(args.personal_number)
+
+    started_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    before = upstream_stats()
+    load_test = LoadTest(
+        users=args.users,
+        duration=args.duration,
+        poll_interval=args.poll_interval,
+        qr_interval=args.qr_interval,
+        login_timeout=args.login_timeout
+    )
+    results = load_test.run()
+    results['upstream_calls'] = upstream_calls(before, upstream_stats())
+    results['started_at'] = started_at
+    results['config'] = vars(args)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    for endpoint, summary in results['endpoints'].items():
+        latency = summary['latency_ms']
+        print(f"{endpoint:16} {summary['requests']:8} req {summary['throughput_rps']:8.1f} req/s "
+              f"p50 {latency['p50'] or 0:7.1f} ms p95 {latency['p95'] or 0:7.1f} ms p99 {latency['p99'] or 0:7.1f} ms "
+              f"{summary['errors']:6} errors {summary['db_queries_per_request'] or 0:5.2f} queries/req")
+    print(f"logins: {results['logins_completed']} completed, {results['logins_failed']} failed, "
+          f"{results['logins_per_s']:.1f}/s; upstream calls: {results['upstream_calls']}")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""
+Local simulator of the BankID RP API (/rp/v6.0/auth, /collect and /cancel) for
+load and latency testing without the external service.
+
+Run it with e.g.
+
+    python -m benchmarks.bankid_simulator --port 8443 \
+        --certfile server.pem --keyfile server.key --client-ca ca_cert.pem \
+        --latency collect=lognormal:3.5:0.6 --error-rate collect=0.01 \
+        --script outstandingTransaction:4,userSign:3,complete
+
+and point BANKID_ENDPOINT at it. Orders live in memory only, so the simulator
+runs as a single asyncio process that can hold tens of thousands of them.
+"""
+import ssl
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import secrets
+import uvicorn
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class LatencyDistribution():
+    """
+    Latency in milliseconds, parsed from 'fixed:MS', 'uniform:LOW:HIGH',
+    'normal:MEAN:STDDEV', 'lognormal:MU:SIGMA' or 'exponential:MEAN'.
+    """
+
+    def __init__(self, spec: str = 'fixed:0') -> None:
+        kind, *params = spec.split(':')
+        self.kind = kind
+        self.params = [float(param) for param in params]
+        if kind not in ('fixed', 'uniform', 'normal', 'lognormal', 'exponential'):
+            raise ValueError(f'Unknown latency distribution: {spec}')
+
+    def sample(self) -> float:
+        if self.kind == 'fixed':
+            milliseconds = self.params[0]
+        elif self.kind == 'uniform':
+            milliseconds = random.uniform(self.params[0], self.params[1])
+        elif self.kind == 'normal':
+            milliseconds = random.gauss(self.params[0], self.params[1])
+        elif self.kind == 'lognormal':
+            milliseconds = random.lognormvariate(self.params[0], self.params[1])
+        else:
+            milliseconds = random.expovariate(1 / self.params[0])
+        return max(milliseconds, 0.0) / 1000
+
+
+class HintCodeScript():
+    """
+    Scripted order progression, e.g. 'outstandingTransaction:4,userSign:3,complete'.
+
+    Every pending step names a hint code and how many seconds it lasts. The last
+    step is terminal: 'complete' or 'failed:<hintCode>'.
+    """
+
+    def __init__(self, spec: str = 'outstandingTransaction:4,userSign:3,complete') -> None:
+        self.steps: List[Tuple[str, float]] = []
+        *pending, terminal = spec.split(',')
+        for step in pending:
+            hint_code, seconds = step.split(':')
+            self.steps.append((hint_code, float(seconds)))
+        self.terminal = terminal
+
+    def state(self, age: float) -> Tuple[str, str]:
+        """
+        @param age: Seconds since the order was created.
+        @return: The (status, hintCode) of an order of that age.
+        """
+        for hint_code, seconds in self.steps:
+            if age < seconds:
+                return 'pending', hint_code
+            age -= seconds
+        if self.terminal == 'complete':
+            return 'complete', ''
+        return 'failed', self.terminal.split(':', 1)[1] if ':' in self.terminal else 'startFailed'
+
+
+class SimulatedOrder():
+    __slots__ = ('created_at', 'end_user_ip', 'cancelled')
+
+    def __init__(self, end_user_ip: str) -> None:
+        self.created_at = time.monotonic()
+        self.end_user_ip = end_user_ip
+        self.cancelled = False
+
+
+class BankIDSimulator():
+    """
+    ASGI application implementing the subset of the BankID RP API v6.0 used by BankIDService.
+    """
+    ORDER_TTL_SECONDS: float = 180.0
+
+    def __init__(self, script: HintCodeScript, latencies: Dict[str, LatencyDistribution],
+                 error_rates: Dict[str, float], personal_number: str) -> None:
+        self.script = script
+        self.latencies = latencies
+        self.error_rates = error_rates
+        self.personal_number = personal_number
+        self.orders: Dict[str, SimulatedOrder] = {}
+        self.calls: Dict[str, int] = {'auth': 0, 'collect': 0, 'cancel': 0}
+        self.errors: Dict[str, int] = {'auth': 0, 'collect': 0, 'cancel': 0}
+        self.last_purge = time.monotonic()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+
+        path = scope['path']
+        if scope['method'] == 'GET' and path == '/stats':
+            await self.respond(send, 200, self.stats())
+            return
+
+        operation = path.rsplit('/', 1)[-1]
+        if scope['method'] != 'POST' or path != f'/rp/v6.0/{operation}' or operation not in self.calls:
+            await self.respond(send, 404, {'errorCode': 'notFound', 'details': 'Not found'})
+            return
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        self.calls[operation] += 1
+        await asyncio.sleep(self.latencies.get(operation, self.latencies['default']).sample())
+
+        if random.random() < self.error_rates.get(operation, 0.0):
+            self.errors[operation] += 1
+            await self.respond(send, 503, {'errorCode': 'maintenance', 'details': 'Simulated error'})
+            return
+
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            await self.respond(send, 400, {'errorCode': 'invalidParameters', 'details': 'Invalid JSON'})
+            return
+
+        status_code, response = getattr(self, operation)(payload, scope)
+        await self.respond(send, status_code, response)
+
+    async def respond(self, send: Send, status_code: int, data: Dict[str, Any]) -> None:
+        body = json.dumps(data).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status_code,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    def purge(self) -> None:
+        now = time.monotonic()
+        if now - self.last_purge < 5:
+            return
+        self.last_purge = now
+        for order_ref in [order_ref for order_ref, order in self.orders.items()
+                          if now - order.created_at > self.ORDER_TTL_SECONDS]:
+            del self.orders[order_ref]
+
+    def auth(self, payload: Dict[str, Any], scope: Scope) -> Tuple[int, Dict[str, Any]]:
+        if not payload.get('endUserIp'):
+            return 400, {'errorCode': 'invalidParameters', 'details': 'Invalid endUserIp'}
+
+        self.purge()
+        order_ref = str(uuid.uuid4())
+        self.orders[order_ref] = SimulatedOrder(end_user_ip=payload['endUserIp'])
+        return 200, {
+            'orderRef': order_ref,
+            'autoStartToken': str(uuid.uuid4()),
+            'qrStartToken': str(uuid.uuid4()),
+            'qrStartSecret': secrets.token_hex(16),
+        }
+
+    def collect(self, payload: Dict[str, Any], scope: Scope) -> Tuple[int, Dict[str, Any]]:
+        order_ref = payload.get('orderRef', '')
+        order = self.orders.get(order_ref)
+        if order is None:
+            return 400, {'errorCode': 'invalidParameters', 'details': 'No such order'}
+
+        if order.cancelled:
+            return 200, {'orderRef': order_ref, 'status': 'failed', 'hintCode': 'userCancel'}
+
+        status, hint_code = self.script.state(time.monotonic() - order.created_at)
+        if status != 'complete':
+            return 200, {'orderRef': order_ref, 'status': status, 'hintCode': hint_code}
+
+        return 200, {
+            'orderRef': order_ref,
+            'status': 'complete',
+            'completionData': {
+                'user': {
+                    'personalNumber': self.personal_number,
+                    'name': 'Simulated User',
+                    'givenName': 'Simulated',
+                    'surname': 'User',
+                },
+                'device': {'ipAddress': order.end_user_ip},
+                'bankIdIssueDate': '2024-01-01',
+                'signature': '',
+                'ocspResponse': '',
+            },
+        }
+
+    def cancel(self, payload: Dict[str, Any], scope: Scope) -> Tuple[int, Dict[str, Any]]:
+        order = self.orders.get(payload.get('orderRef', ''))
+        if order is None:
+            return 400, {'errorCode': 'invalidParameters', 'details': 'No such order'}
+        order.cancelled = True
+        return 200, {}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'orders': len(self.orders),
+            'calls': self.calls,
+            'errors': self.errors,
+        }
+
+
+def parse_operation_options(options: List[str], cast: Callable[[str], Any]) -> Dict[str, Any]:
+    parsed: Dict[str, Any] = {}
+    for option in options:
+        operation, value = option.split('=', 1)
+        parsed[operation] = cast(value)
+    return parsed
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Local BankID RP API simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--certfile', help='Server certificate (PEM), enables TLS')
+    parser.add_argument('--keyfile', help='Server private key (PEM)')
+    parser.add_argument('--client-ca', help='CA for client certificates, enables mTLS')
+    parser.add_argument('--latency', action='append', default=[],
+                        help='OPERATION=DISTRIBUTION, e.g. collect=lognormal:3.5:0.6 (milliseconds); OPERATION may be default')
+    parser.add_argument('--error-rate', action='append', default=[],
+                        help='OPERATION=RATE, share of calls answered with 503, e.g. collect=0.01')
+    parser.add_argument('--script', default='outstandingTransaction:4,userSign:3,complete',
+                        help='Hint code sequence, e.g. outstandingTransaction:4,userSign:3,complete or ...,failed:userCancel')
+    parser.add_argument('--personal-number', default='199001012385', help='Personal number returned on completion')
+    args = parser.parse_args(argv)
+
+    latencies = {'default': LatencyDistribution('fixed:0')}
+    latencies.update(parse_operation_options(args.latency, LatencyDistribution))
+
+    simulator = BankIDSimulator(
+        script=HintCodeScript(args.script),
+        latencies=latencies,
+        error_rates=parse_operation_options(args.error_rate, float),
+        personal_number=args.personal_number
+    )
+
+    uvicorn.run(
+        simulator,
+        host=args.host,
+        port=args.port,
+        ssl_certfile=args.certfile,
+        ssl_keyfile=args.keyfile,
+        ssl_ca_certs=args.client_ca,
+        ssl_cert_reqs=ssl.CERT_REQUIRED if args.client_ca else ssl.CERT_NONE,
+        backlog=4096,
+        access_log=False,
+        log_level='warning'
+    )
+
+
+if __name__ == '__main__':
+    main()
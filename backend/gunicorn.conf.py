@@ -0,0 +1,28 @@
+# gunicorn.conf.py
+import os
+from prometheus_client import multiprocess
+from typing import Any
+
+
+def post_worker_init(worker: Any) -> None:
+    # Background threads run in server workers only, not in every process that loads Django
+    # (migrate, shell, tests, management commands). Django is set up once the worker has loaded the app.
+    from django.conf import settings
+
+    if str(getattr(settings, 'BANKID', {}).get('collector_enabled')).lower() in ('1', 'true'):
+        # Every worker runs one, the leader lease in the cache keeps all but one idle.
+        from authentication.services.bankid_collector import BankIDCollector
+        BankIDCollector.from_settings().start()
+
+    reaper_settings = getattr(settings, 'AUTHENTICATION_REAPER', {})
+    if str(reaper_settings.get('enabled')).lower() in ('1', 'true'):
+        # A lock in the cache lets only one worker per interval reap.
+        from authentication.services.expired_authentication_reaper import ExpiredAuthenticationReaper
+        ExpiredAuthenticationReaper(batch_size=int(reaper_settings.get('batch_size') or 1000)).start(
+            interval=float(reaper_settings.get('interval') or 300))
+
+
+def child_exit(server: Any, worker: Any) -> None:
+    # Drop the live gauges of exited workers from the aggregated BankID metrics.
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
+
+The async BankID views are only non-blocking when served from here, e.g.
+``gunicorn project.asgi:application -k uvicorn.workers.UvicornWorker``.
 """
 
 import os
@@ -47,6 +47,17 @@ JWT_AUTH: Dict[str, Any] = {
     'JWT_ALGORITHM': 'HS256',
     'JWT_EXPIRATION_DELTA': timedelta(days=1),
     'JWT_REFRESH_EXPIRATION_DELTA': timedelta(days=7),
+    # Active refresh tokens kept per user, the oldest sessions are revoked beyond this
+    'JWT_REFRESH_TOKENS_PER_USER': 10,
+    # A rotated refresh token used again within this window (e.g. by parallel requests of the
+    # same client) rotates once more, later reuse revokes the whole token family
+    'JWT_REFRESH_REUSE_GRACE': timedelta(seconds=10),
+    # Embed account_id, is_superuser and the effective permissions in access tokens
+    'JWT_CLAIMS_MODE': False,
+    # Asymmetric signing keys, e.g. [{'kid': '2026-10', 'algorithm': 'EdDSA', 'signing': True,
+    # 'private_key_path': ..., 'public_key_path': ...}]. Tokens without a kid are still verified
+    # with JWT_SECRET_KEY while it is set, so it can be cleared once those tokens have expired.
+    'JWT_SIGNING_KEYS': [],
 }
 
 MIDDLEWARE: List[str] = [
@@ -145,6 +156,24 @@ BANKID: Dict[str, str | None] = {
     'p12_cert_path': get_secret('BANKID_CERT_P12_PATH'),
     'p12_password': get_secret('BANKID_PKCS12_PASSWORD'),
     'ca_cert_path': get_secret('BANKID_CA_CERT'),
+    'pool_maxsize': get_secret('BANKID_POOL_MAXSIZE', '10'),
+    'collector_enabled': get_secret('BANKID_COLLECTOR_ENABLED', 'false'),
+    'collector_workers': get_secret('BANKID_COLLECTOR_WORKERS', '8'),
+    'collect_interval': get_secret('BANKID_COLLECT_INTERVAL', '2'),
+    'order_store': get_secret('BANKID_ORDER_STORE', 'default'),
+    'initiate_ip_rate': get_secret('BANKID_INITIATE_IP_RATE', '0.1'),
+    'initiate_ip_burst': get_secret('BANKID_INITIATE_IP_BURST', '5'),
+    'initiate_global_rate': get_secret('BANKID_INITIATE_GLOBAL_RATE', '50'),
+    'initiate_global_burst': get_secret('BANKID_INITIATE_GLOBAL_BURST', '200'),
+    'max_open_orders': get_secret('BANKID_MAX_OPEN_ORDERS', '5000'),
+    'batch_poll_concurrency': get_secret('BANKID_BATCH_POLL_CONCURRENCY', '16'),
+    'metrics_allowed_ips': get_secret('BANKID_METRICS_ALLOWED_IPS', '127.0.0.1,::1'),
+}
+
+AUTHENTICATION_REAPER: Dict[str, str | None] = {
+    'enabled': get_secret('AUTHENTICATION_REAPER_ENABLED', 'false'),
+    'interval': get_secret('AUTHENTICATION_REAPER_INTERVAL', '300'),
+    'batch_size': get_secret('AUTHENTICATION_REAPER_BATCH_SIZE', '1000'),
 }
 
 LOGGING: Dict[str, Any] = {
@@ -41,6 +41,17 @@ JWT_AUTH: Dict[str, Any] = {
     'JWT_ALGORITHM': 'HS256',
     'JWT_EXPIRATION_DELTA': timedelta(days=1),
     'JWT_REFRESH_EXPIRATION_DELTA': timedelta(days=7),
+    # Active refresh tokens kept per user, the oldest sessions are revoked beyond this
+    'JWT_REFRESH_TOKENS_PER_USER': 10,
+    # A rotated refresh token used again within this window (e.g. by parallel requests of the
+    # same client) rotates once more, later reuse revokes the whole token family
+    'JWT_REFRESH_REUSE_GRACE': timedelta(seconds=10),
+    # Embed account_id, is_superuser and the effective permissions in access tokens
+    'JWT_CLAIMS_MODE': False,
+    # Asymmetric signing keys, e.g. [{'kid': '2026-10', 'algorithm': 'EdDSA', 'signing': True,
+    # 'private_key_path': ..., 'public_key_path': ...}]. Tokens without a kid are still verified
+    # with JWT_SECRET_KEY while it is set, so it can be cleared once those tokens have expired.
+    'JWT_SIGNING_KEYS': [],
 }
 
 MIDDLEWARE: List[str] = [
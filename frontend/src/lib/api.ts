@@ -7,7 +7,7 @@ import {
   clearTokens,
 } from "./auth";
 
-const BASE_URL = "http://localhost:8000/api/";
+export const BASE_URL = "http://localhost:8000/api/";
 
 async function fetchWithHeaders(
   url: string | Request,
@@ -81,7 +81,7 @@ export async function checkTokenValidity(): Promise<boolean> {
     }
 
     const refreshData = await refreshResponse.json();
-    setTokens(refreshData.access_token, refreshToken);
+    setTokens(refreshData.access_token, refreshData.refresh_token);
     return true;
   } catch (error) {
     clearTokens();
@@ -109,7 +109,7 @@ async function handle401(
 
     const refreshData = await refreshResponse.json();
 
-    setTokens(refreshData.access_token, refreshToken);
+    setTokens(refreshData.access_token, refreshData.refresh_token);
 
     const response = await fetchWithHeaders(
       originalRequest,
@@ -143,7 +143,7 @@ async function parseResponse(
     } catch (error) {
       throw new Error(t("Failed to parse JSON response"));
     }
-  } else if (contentType && contentType.includes("image/png")) {
+  } else if (contentType && contentType.startsWith("image/")) {
     try {
       const blob = await response.blob();
       return URL.createObjectURL(blob);
@@ -4,7 +4,7 @@ import { useNavigate } from "react-router-dom";
 import BankIDLogo from "../../components/icons/BankIDLogo";
 import { useTheme } from "../../components/theme-provider";
 import { useTranslation } from "react-i18next";
-import { useApiRequest } from "../../lib/api";
+import { BASE_URL, useApiRequest } from "../../lib/api";
 import { useAuth } from "../../context/AuthContext";
 import { AlertDestructive } from "../../components/ui/AlertDestructive";
 import { RotateCcw } from "lucide-react";
@@ -27,38 +27,45 @@ const BankIDLogin = () => {
   const [error, setError] = useState("");
   const [loading, setLoading] = useState(false);
 
-  const intervalRef = useRef<NodeJS.Timeout | null>(null);
+  const eventSourceRef = useRef<EventSource | null>(null);
+  const qrIntervalRef = useRef<NodeJS.Timeout | null>(null);
+  const pollTimeoutRef = useRef<NodeJS.Timeout | null>(null);
+
+  const closeEventSource = () => {
+    if (eventSourceRef.current) {
+      eventSourceRef.current.close();
+      eventSourceRef.current = null;
+    }
+  };
 
   const clearPollingInterval = () => {
-    if (intervalRef.current) {
-      clearInterval(intervalRef.current);
-      intervalRef.current = null;
+    if (qrIntervalRef.current) {
+      clearInterval(qrIntervalRef.current);
+      qrIntervalRef.current = null;
     }
+    if (pollTimeoutRef.current) {
+      clearTimeout(pollTimeoutRef.current);
+      pollTimeoutRef.current = null;
+    }
+  };
+
+  const stopUpdates = () => {
+    closeEventSource();
+    clearPollingInterval();
   };
 
   const initiateBankID = async () => {
     setError("");
     setLoading(true);
-    clearPollingInterval();
+    stopUpdates();
 
     try {
       const response = await apiRequest("authentication/bankid/initiate/", {
         method: "POST",
       });
 
-      fetchQrCode(response.orderRef);
-
       setLoading(false);
-
-      intervalRef.current = setInterval(async () => {
-        try {
-          await pollAuthentication(response.orderRef);
-          await fetchQrCode(response.orderRef);
-        } catch (error: any) {
-          setError(error.message);
-          clearPollingInterval();
-        }
-      }, 1000);
+      subscribeToOrder(response.orderRef);
     } catch (error: any) {
       setError(error.message);
     }
@@ -67,43 +74,123 @@ const BankIDLogin = () => {
   useEffect(() => {
     initiateBankID();
 
-    return () => clearPollingInterval();    ;
+    return () => stopUpdates();
   }, []);
 
   const fetchQrCode = async (orderRef: string) => {
-    try {
-      const response = await apiRequest(
-        `authentication/bankid/qr/${orderRef}/`,
-        {
-          method: "GET",
-        }
-      );
-      setQrCode(response);
-    } catch (error: any) {
-      setError(error.message);
-    }
+    const response = await apiRequest(
+      `authentication/bankid/qr/${orderRef}/`,
+      {
+        method: "GET",
+      }
+    );
+    setQrCode(response);
   };
 
-  const pollAuthentication = async (orderRef: string) => {
-    try {
-      const response = await apiRequest(
-        `authentication/bankid/poll/${orderRef}/`,
-        {
-          method: "GET",
-        }
-      );
-
-      if (response.message === "Please start the BankID app.") return;
-      if (!response.message) {
-        setAuthTokens(response.access_token, response.refresh_token);
-        navigate("/permissions");
+  // Returns the seconds the server asks us to wait before the next poll, or null once the order is complete.
+  const pollAuthentication = async (orderRef: string): Promise<number | null> => {
+    const response = await apiRequest(
+      `authentication/bankid/poll/${orderRef}/`,
+      {
+        method: "GET",
       }
+    );
 
+    if (!response.message) {
+      clearPollingInterval();
+      setAuthTokens(response.access_token, response.refresh_token);
+      navigate("/permissions");
+      return null;
+    }
+    if (response.message !== "Please start the BankID app.") {
       setMessage(response.message);
-    } catch (error: any) {
+    }
+    return typeof response.pollAfter === "number" ? response.pollAfter : 2;
+  };
+
+  // Fallback for browsers without EventSource and for servers or proxies that do not stream.
+  const pollOrder = (orderRef: string) => {
+    const fail = (error: any) => {
       setError(error.message);
-      throw error;
+      clearPollingInterval();
+    };
+
+    // The QR code changes every second, the status only as often as the server's pollAfter allows.
+    fetchQrCode(orderRef).catch(fail);
+    qrIntervalRef.current = setInterval(() => {
+      fetchQrCode(orderRef).catch(fail);
+    }, 1000);
+
+    const schedulePoll = (seconds: number) => {
+      pollTimeoutRef.current = setTimeout(async () => {
+        try {
+          const pollAfter = await pollAuthentication(orderRef);
+          if (pollAfter !== null && qrIntervalRef.current) schedulePoll(pollAfter);
+        } catch (error: any) {
+          fail(error);
+        }
+      }, seconds * 1000);
+    };
+    schedulePoll(1);
+  };
+
+  const subscribeToOrder = (orderRef: string) => {
+    if (typeof EventSource === "undefined") {
+      pollOrder(orderRef);
+      return;
     }
+
+    let receivedEvent = false;
+    const eventSource = new EventSource(
+      `${BASE_URL}authentication/bankid/stream/${orderRef}/`,
+      { withCredentials: true }
+    );
+    eventSourceRef.current = eventSource;
+
+    const fallBackToPolling = () => {
+      if (eventSourceRef.current !== eventSource) return;
+      closeEventSource();
+      pollOrder(orderRef);
+    };
+    // The first frames are sent right away, a stream that stays silent is being buffered.
+    setTimeout(() => {
+      if (!receivedEvent) fallBackToPolling();
+    }, 5000);
+
+    eventSource.addEventListener("qr", (event: MessageEvent) => {
+      receivedEvent = true;
+      setQrCode(JSON.parse(event.data).qr);
+    });
+
+    eventSource.addEventListener("status", (event: MessageEvent) => {
+      receivedEvent = true;
+      const data = JSON.parse(event.data);
+      if (data.message === "Please start the BankID app.") return;
+      setMessage(data.message);
+    });
+
+    eventSource.addEventListener("complete", (event: MessageEvent) => {
+      const data = JSON.parse(event.data);
+      closeEventSource();
+      setAuthTokens(data.access_token, data.refresh_token);
+      navigate("/permissions");
+    });
+
+    eventSource.addEventListener("failed", (event: MessageEvent) => {
+      closeEventSource();
+      setError(JSON.parse(event.data).detail);
+    });
+
+    eventSource.onerror = () => {
+      if (!receivedEvent) {
+        fallBackToPolling();
+        return;
+      }
+      if (eventSource.readyState === EventSource.CLOSED) {
+        closeEventSource();
+        setError(t("Something went wrong."));
+      }
+    };
   };
 
   return (